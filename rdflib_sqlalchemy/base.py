@@ -1,13 +1,91 @@
 """Base classes for the store."""
-from rdflib import Literal
+from rdflib import RDF, BNode, Literal, URIRef
 from rdflib.graph import Graph, QuotedGraph
 from rdflib.plugins.stores.regexmatching import REGEXTerm
+from six import text_type
 from sqlalchemy.sql import expression
 
+from rdflib_sqlalchemy.constants import TERM_COMBINATIONS
+from rdflib_sqlalchemy.tables import hash_column
 from rdflib_sqlalchemy.termutils import (
+    term_combination,
     type_to_term_combination,
     statement_to_term_combination,
 )
+from rdflib_sqlalchemy.types import term_hash, term_text
+
+
+TERM_COLUMNS = ("subject", "predicate", "object", "context", "member", "klass")
+''' Statement table columns holding terms (term ids in a dictionary-encoded store) '''
+
+STATEMENT_ROW_COLUMNS = ("subject", "predicate", "object", "context", "termComb")
+FULL_STATEMENT_ROW_COLUMNS = STATEMENT_ROW_COLUMNS + ("objLanguage", "objDatatype")
+TYPE_ROW_COLUMNS = ("member", "klass", "context", "termComb")
+''' Columns of the rows built by `SQLGeneratorMixin._build_statement_rows`, for the
+asserted, the literal and quoted, and the rdf:type partitions, in the order of the table columns '''
+
+GRAPH_TERM_COMBINATIONS = frozenset(
+    value for termComb, value in TERM_COMBINATIONS.items() if "F" in termComb[:3])
+''' Term combinations of the statements with a formula as subject or object '''
+
+
+def literal_language(term):
+    """
+    Return the language tag of ``term`` as stored, or None.
+
+    Language tags are case-insensitive, so they are stored (and looked up) in
+    lower case, and a literal is stored once whatever the case of its tag.
+    """
+    if isinstance(term, Literal) and term.language:
+        return term.language.lower()
+    return None
+
+
+class TermParameter(object):
+    """
+    A placeholder for a term, for building a query once for every pattern of
+    the same shape (see `SQLAlchemy.triples`).
+
+    It is a term of the same kind as the term it stands for, so that the
+    query is built the same way, but it is compared with the bind parameter
+    named by its text (and its language and datatype with the bind parameters
+    ``object_language`` and ``object_datatype``).
+    """
+
+
+class URIRefParameter(TermParameter, URIRef):
+    pass
+
+
+class BNodeParameter(TermParameter, BNode):
+    pass
+
+
+class LiteralParameter(TermParameter, Literal):
+    pass
+
+
+def term_parameter(term, name):
+    """Return the `TermParameter` named ``name`` standing for ``term``."""
+    if isinstance(term, Literal):
+        # Only whether there is a language and a datatype matters
+        return LiteralParameter(
+            name,
+            lang=term.language and "und",
+            datatype=term.datatype and URIRef("urn:x-datatype"))
+    elif isinstance(term, BNode):
+        return BNodeParameter(name)
+    return URIRefParameter(name)
+
+
+class TermChoices(object):
+    """
+    The choices of a term of a `triples_choices` pattern, held in a temporary
+    table (see `create_choices_table`) instead of a list.
+    """
+
+    def __init__(self, table):
+        self.table = table
 
 
 class SQLGeneratorMixin(object):
@@ -24,6 +102,68 @@ class SQLGeneratorMixin(object):
             "termComb": int(type_to_term_combination(member, klass, context))
         }
 
+    def _build_statement_rows(self, quads, contexts, by_context=False):
+        """
+        Build the rows inserting quads in their statement tables.
+
+        The same rows as the parameters of `_get_build_command`, as plain
+        tuples of the values of the `STATEMENT_ROW_COLUMNS`,
+        `FULL_STATEMENT_ROW_COLUMNS` or `TYPE_ROW_COLUMNS` of the table, with
+        the term combination looked up from the classes of the terms. Terms
+        are left as they are, except formulas, replaced by their identifier,
+        so that a driver can bind every value.
+
+        Args:
+            quads: iterable of ``(subject, predicate, object, context)`` quads
+            contexts (set): set the identifiers of the contexts are added to
+            by_context (bool): Whether to group the rows by context too
+
+        Returns:
+            dict: mapping from ``(table, context)`` to a ``(columns, rows)`` pair,
+                where context is the identifier of the context of the rows if
+                ``by_context`` and None otherwise
+        """
+        literal_table = self.tables["literal_statements"]
+        asserted_table = self.tables["asserted_statements"]
+        quoted_table = self.tables["quoted_statements"]
+        type_table = self.tables["type_statements"]
+        rdf_type = RDF.type
+        commands = {}
+        for subject, predicate, obj, context in quads:
+            identifier = context.identifier
+            contexts.add(identifier)
+            quoted = isinstance(context, QuotedGraph)
+            try:
+                termComb = term_combination(subject, predicate, obj, context)
+            except KeyError:
+                if quoted or predicate != rdf_type:
+                    raise
+                # Raises the ValueError of a Literal member
+                termComb = type_to_term_combination(subject, obj, context)
+            if termComb in GRAPH_TERM_COMBINATIONS:
+                subject, obj = term_text(subject), term_text(obj)
+
+            if quoted or predicate != rdf_type:
+                if isinstance(obj, Literal):
+                    table, columns = literal_table, FULL_STATEMENT_ROW_COLUMNS
+                    row = (subject, predicate, obj, identifier, termComb, literal_language(obj), obj.datatype or None)
+                elif quoted:
+                    table, columns = quoted_table, FULL_STATEMENT_ROW_COLUMNS
+                    row = (subject, predicate, obj, identifier, termComb, None, None)
+                else:
+                    table, columns = asserted_table, STATEMENT_ROW_COLUMNS
+                    row = (subject, predicate, obj, identifier, termComb)
+            else:
+                table, columns = type_table, TYPE_ROW_COLUMNS
+                row = (subject, obj, identifier, termComb)
+
+            key = (table, identifier if by_context else None)
+            command = commands.get(key)
+            if command is None:
+                command = commands[key] = (columns, [])
+            command[1].append(row)
+        return commands
+
     def _build_literal_triple_sql_command(self, subject, predicate, obj, context):
         """
         Build an insert command for literal triples.
@@ -43,7 +183,7 @@ class SQLGeneratorMixin(object):
             "object": obj,
             "context": context.identifier,
             "termComb": triple_pattern,
-            "objLanguage": isinstance(obj, Literal) and obj.language or None,
+            "objLanguage": literal_language(obj),
             "objDatatype": isinstance(obj, Literal) and obj.datatype or None,
         }
         return command, values
@@ -74,7 +214,7 @@ class SQLGeneratorMixin(object):
                 "object": obj,
                 "context": context.identifier,
                 "termComb": triple_pattern,
-                "objLanguage": isinstance(obj, Literal) and obj.language or None,
+                "objLanguage": literal_language(obj),
                 "objDatatype": isinstance(obj, Literal) and obj.datatype or None
             }
         else:
@@ -113,18 +253,110 @@ class SQLGeneratorMixin(object):
 
     def build_literal_datatype_clause(self, obj, table):
         """Build Literal and datatype clause."""
-        if isinstance(obj, Literal) and obj.datatype is not None:
+        if isinstance(obj, TermParameter) and isinstance(obj, Literal) and obj.datatype is not None:
+            return table.c.objDatatype == expression.bindparam("object_datatype")
+        elif isinstance(obj, Literal) and obj.datatype is not None:
             return table.c.objDatatype == obj.datatype
         else:
             return None
 
     def build_literal_language_clause(self, obj, table):
         """Build Literal and language clause."""
-        if isinstance(obj, Literal) and obj.language is not None:
-            return table.c.objLanguage == obj.language
+        if isinstance(obj, TermParameter) and isinstance(obj, Literal) and obj.language is not None:
+            return table.c.objLanguage == expression.bindparam("object_language")
+        elif isinstance(obj, Literal) and obj.language is not None:
+            return table.c.objLanguage == literal_language(obj)
         else:
             return None
 
+    def build_term_id_select(self, term):
+        """Build a scalar subquery for the id of a term in the term dictionary."""
+        terms = self.tables["terms"]
+        return expression.select(terms.c.id).where(
+            self.build_term_clause(terms.c.term, term, False)).scalar_subquery()
+
+    def build_term_clause(self, column, term, term_dictionary=None):
+        """
+        Build a clause matching a term column against a term.
+
+        With hash keys the indexed hash key column is probed first, and the
+        text is compared as well so that a hash collision cannot match a
+        different term.
+        """
+        if term_dictionary is None:
+            term_dictionary = self.term_dictionary
+        if isinstance(term, TermParameter):
+            value = expression.bindparam(text_type(term))
+            hash_value = expression.bindparam(hash_column(text_type(term)))
+        else:
+            value = term
+            hash_value = term_hash(term) if self.hash_keys else None
+        if term_dictionary:
+            return column == self.build_term_id_select(term)
+        elif self.hash_keys:
+            return expression.and_(
+                column.table.c[hash_column(column.name)] == hash_value,
+                column == value)
+        return column == value
+
+    def build_term_text(self, column):
+        """
+        Build an expression for the text of the terms in a term column.
+
+        In a dictionary-encoded store this is a correlated lookup of the term
+        id in the term dictionary.
+        """
+        if self.term_dictionary:
+            terms = self.tables["terms"]
+            return expression.select(terms.c.term).where(terms.c.id == column).scalar_subquery()
+        return column
+
+    def build_term_in_clause(self, column, terms):
+        """
+        Build a clause matching a term column against any of a list of terms,
+        or of the terms of a `TermChoices` table.
+
+        The terms of a list are compared with a single ``IN`` (an expanding
+        bind parameter), and regular expressions with one clause each.
+        """
+        if isinstance(terms, TermChoices):
+            choices = terms.table
+            clause = column.in_(expression.select(choices.c.term))
+            if self.hash_keys and not self.term_dictionary:
+                hashes = expression.select(choices.c[hash_column("term")])
+                clause = expression.and_(column.table.c[hash_column(column.name)].in_(hashes), clause)
+            return clause
+
+        clauses = [self.build_regexp_clause(column, term) for term in terms if isinstance(term, REGEXTerm)]
+        texts = [term_text(term) for term in terms if term and not isinstance(term, REGEXTerm)]
+        if texts and self.term_dictionary:
+            terms_table = self.tables["terms"]
+            clauses.append(column.in_(expression.select(terms_table.c.id).where(
+                self._build_text_in_clause(terms_table.c.term, texts))))
+        elif texts:
+            clauses.append(self._build_text_in_clause(column, texts))
+
+        if not clauses:
+            return None
+        return expression.or_(*clauses) if len(clauses) > 1 else clauses[0]
+
+    def _build_text_in_clause(self, column, texts):
+        if self.hash_keys:
+            return expression.and_(
+                column.table.c[hash_column(column.name)].in_([term_hash(text) for text in texts]),
+                column.in_(texts))
+        return column.in_(texts)
+
+    def build_regexp_clause(self, column, pattern):
+        """
+        Build a clause matching a term column against a regular expression.
+
+        The operator is chosen by the dialect: ``~`` on PostgreSQL and
+        ``REGEXP`` on MySQL and SQLite (see
+        :func:`~rdflib_sqlalchemy.sql.register_sqlite_regexp`).
+        """
+        return self.build_term_text(column).regexp_match(text_type(pattern))
+
     # Where Clause  utility Functions
     # The predicate and object clause builders are modified in order
     # to optimize subjects and objects utility functions which can
@@ -133,16 +365,13 @@ class SQLGeneratorMixin(object):
     def build_subject_clause(self, subject, table):
         """Build Subject clause."""
         if isinstance(subject, REGEXTerm):
-            # TODO: this work only in mysql. Must adapt for postgres and sqlite
-            return table.c.subject.op("REGEXP")(subject)
-        elif isinstance(subject, list):
-            # clauseStrings = [] --- unused
-            return expression.or_(
-                *[self.build_subject_clause(s, table) for s in subject if s])
+            return self.build_regexp_clause(table.c.subject, subject)
+        elif isinstance(subject, (list, TermChoices)):
+            return self.build_term_in_clause(table.c.subject, subject)
         elif isinstance(subject, (QuotedGraph, Graph)):
-            return table.c.subject == subject.identifier
+            return self.build_term_clause(table.c.subject, subject.identifier)
         elif subject is not None:
-            return table.c.subject == subject
+            return self.build_term_clause(table.c.subject, subject)
         else:
             return None
 
@@ -155,13 +384,11 @@ class SQLGeneratorMixin(object):
 
         """
         if isinstance(predicate, REGEXTerm):
-            # TODO: this work only in mysql. Must adapt for postgres and sqlite
-            return table.c.predicate.op("REGEXP")(predicate)
-        elif isinstance(predicate, list):
-            return expression.or_(
-                *[self.build_predicate_clause(p, table) for p in predicate if p])
+            return self.build_regexp_clause(table.c.predicate, predicate)
+        elif isinstance(predicate, (list, TermChoices)):
+            return self.build_term_in_clause(table.c.predicate, predicate)
         elif predicate is not None:
-            return table.c.predicate == predicate
+            return self.build_term_clause(table.c.predicate, predicate)
         else:
             return None
 
@@ -174,50 +401,43 @@ class SQLGeneratorMixin(object):
 
         """
         if isinstance(obj, REGEXTerm):
-            # TODO: this work only in mysql. Must adapt for postgres and sqlite
-            return table.c.object.op("REGEXP")(obj)
-        elif isinstance(obj, list):
-            return expression.or_(
-                *[self.build_object_clause(o, table) for o in obj if o])
+            return self.build_regexp_clause(table.c.object, obj)
+        elif isinstance(obj, (list, TermChoices)):
+            return self.build_term_in_clause(table.c.object, obj)
         elif isinstance(obj, (QuotedGraph, Graph)):
-            return table.c.object == obj.identifier
+            return self.build_term_clause(table.c.object, obj.identifier)
         elif obj is not None:
-            return table.c.object == obj
+            return self.build_term_clause(table.c.object, obj)
         else:
             return None
 
     def build_context_clause(self, context, table):
         """Build Context clause."""
         if isinstance(context, REGEXTerm):
-            # TODO: this work only in mysql. Must adapt for postgres and sqlite
-            return table.c.context.op("regexp")(context.identifier)
+            return self.build_regexp_clause(table.c.context, context)
         elif context is not None and context.identifier is not None:
-            return table.c.context == context.identifier
+            return self.build_term_clause(table.c.context, context.identifier)
         else:
             return None
 
     def build_type_member_clause(self, subject, table):
         """Build Type Member clause."""
         if isinstance(subject, REGEXTerm):
-            # TODO: this work only in mysql. Must adapt for postgres and sqlite
-            return table.c.member.op("regexp")(subject)
-        elif isinstance(subject, list):
-            return expression.or_(
-                *[self.build_type_member_clause(s, table) for s in subject if s])
+            return self.build_regexp_clause(table.c.member, subject)
+        elif isinstance(subject, (list, TermChoices)):
+            return self.build_term_in_clause(table.c.member, subject)
         elif subject is not None:
-            return table.c.member == subject
+            return self.build_term_clause(table.c.member, subject)
         else:
             return None
 
     def build_type_class_clause(self, obj, table):
         """Build Type Class clause."""
         if isinstance(obj, REGEXTerm):
-            # TODO: this work only in mysql. Must adapt for postgres and sqlite
-            return table.c.klass.op("regexp")(obj)
-        elif isinstance(obj, list):
-            return expression.or_(
-                *[self.build_type_class_clause(o, table) for o in obj if o])
+            return self.build_regexp_clause(table.c.klass, obj)
+        elif isinstance(obj, (list, TermChoices)):
+            return self.build_term_in_clause(table.c.klass, obj)
         elif obj is not None:
-            return obj and table.c.klass == obj
+            return self.build_term_clause(table.c.klass, obj)
         else:
             return None
@@ -0,0 +1,302 @@
+"""Bulk loading mixin"""
+import collections
+import io
+import itertools
+import os
+import tempfile
+import warnings
+from contextlib import contextmanager
+
+from six import text_type
+from sqlalchemy import MetaData, event
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.sql import expression, select
+
+from rdflib_sqlalchemy.counts import PARTITION_TABLES
+from rdflib_sqlalchemy.tables import create_staging_table
+from rdflib_sqlalchemy.types import term_text
+
+
+COPY_ESCAPES = {ord("\\"): "\\\\", ord("\t"): "\\t", ord("\n"): "\\n", ord("\r"): "\\r"}
+''' Escapes of the text format of PostgreSQL COPY and MySQL LOAD DATA '''
+
+BULK_MODE_PRAGMAS = (
+    ("journal_mode", "MEMORY"),
+    ("synchronous", "OFF"),
+    ("cache_size", -262144),
+    ("temp_store", "MEMORY"),
+)
+''' SQLite settings of the connections of a store in `~BulkLoadMixin.bulk_mode`: the rollback journal
+is kept in memory, nothing is synced to disk and the page cache holds 256 MiB '''
+
+
+def copy_text(rows):
+    """
+    Format rows in the text format read by PostgreSQL ``COPY`` and MySQL ``LOAD DATA``.
+
+    Fields are separated by tabs and rows end with a newline, backslashes,
+    tabs and newlines are escaped with a backslash and NULL is ``\\N``.
+    """
+    return "".join(
+        "\t".join("\\N" if value is None else text_type(value).translate(COPY_ESCAPES) for value in row) + "\n"
+        for row in rows
+    )
+
+
+class BulkLoadMixin:
+    '''
+    Loads large numbers of statements by filling a temporary staging table
+    per partition with the native bulk loading statement of the database,
+    and merging each staging table into its partition with one
+    ``INSERT ... SELECT`` that ignores the statements that exist already.
+    '''
+
+    @contextmanager
+    def bulk_mode(self, pragmas=BULK_MODE_PRAGMAS, analyze=True):
+        """
+        Prepare the store for loading many statements, e.g. with `bulk_load`.
+
+        On entry the non-unique indexes of the statement tables are dropped, so
+        that inserts only maintain the unique keys, and on SQLite the connections
+        checked out from the engine get ``pragmas``, which are reset when they
+        are checked in. On exit, even on an error, the indexes are rebuilt (with
+        ``CREATE INDEX CONCURRENTLY`` on PostgreSQL) and the tables analyzed.
+
+        The settings trade durability for speed: a crash in bulk mode can
+        corrupt an SQLite database. Lookups are slow until the indexes are
+        rebuilt. Entering bulk mode again rebuilds the indexes that are missing
+        after an interruption.
+
+        Args:
+            pragmas: ``(name, value)`` pairs of SQLite PRAGMAs
+            analyze (bool): Whether to update the statistics of the tables on exit
+        """
+        indexes = [
+            index
+            for name in PARTITION_TABLES.values()
+            for index in self.tables[name].indexes
+            if not index.unique
+        ]
+        with self.engine.begin() as connection, _quiet_index_reflection():
+            for index in indexes:
+                index.drop(connection, checkfirst=True)
+
+        relax = _relax_pragmas(pragmas) if self.engine.name == "sqlite" and pragmas else None
+        if relax:
+            event.listen(self.engine, "checkout", relax)
+            event.listen(self.engine, "checkin", _reset_pragmas)
+        try:
+            yield self
+        finally:
+            if relax:
+                event.remove(self.engine, "checkout", relax)
+                event.remove(self.engine, "checkin", _reset_pragmas)
+            self._create_indexes(indexes)
+            if analyze:
+                self._analyze_tables([self.tables[name] for name in PARTITION_TABLES.values()])
+
+    def _create_indexes(self, indexes):
+        """Create the indexes that do not exist, concurrently on PostgreSQL."""
+        if self.engine.name != "postgresql":
+            with self.engine.begin() as connection, _quiet_index_reflection():
+                for index in indexes:
+                    index.create(connection, checkfirst=True)
+            return
+
+        # CREATE INDEX CONCURRENTLY cannot run in a transaction
+        with self.engine.connect() as connection, _quiet_index_reflection():
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            for index in indexes:
+                options = index.dialect_options["postgresql"]
+                options["concurrently"] = True
+                try:
+                    index.create(connection, checkfirst=True)
+                finally:
+                    options["concurrently"] = False
+
+    def _analyze_tables(self, tables):
+        """Update the statistics the query planner keeps on tables."""
+        template = "ANALYZE TABLE {}" if self.engine.name == "mysql" else "ANALYZE {}"
+        with self.engine.begin() as connection:
+            preparer = connection.dialect.identifier_preparer
+            for table in tables:
+                connection.exec_driver_sql(template.format(preparer.format_table(table)))
+
+    def bulk_load(self, quads, batch_size=None, native=True):
+        """
+        Add quads, as `addN` does, in a single transaction.
+
+        The quads are read in batches of ``batch_size`` and each batch is
+        written to the staging tables with ``COPY ... FROM STDIN`` on
+        PostgreSQL (with the psycopg2 or psycopg driver), ``LOAD DATA LOCAL
+        INFILE`` on MySQL and a prepared ``executemany`` on SQLite and other
+        databases. A `TriplesAddedEvent` is dispatched for each batch, but no
+        `~rdflib.store.TripleAddedEvent` for each quad.
+
+        Args:
+            quads: iterable of ``(subject, predicate, object, context)`` quads
+            batch_size (int): The number of quads held in memory at a time. Defaults to
+                the `chunk_size` of the store
+            native (bool): Whether to use ``COPY`` or ``LOAD DATA``. ``LOAD DATA
+                LOCAL INFILE`` must be allowed by both the MySQL server and driver
+                (e.g. the ``local_infile`` connection argument of mysqlclient).
+        """
+        quads = iter(quads)
+        batch_size = batch_size or self.chunk_size
+        staging = {}
+        contexts = set()
+        with self._begin_adding() as (connection, term_ids):
+            while True:
+                batch = list(itertools.islice(quads, batch_size))
+                if not batch:
+                    break
+                self._dispatch_added(batch, per_quad=False)
+                for table, rows in self._bulk_rows(connection, batch, contexts, term_ids).items():
+                    if table.name not in staging:
+                        staging_table = create_staging_table(table, MetaData())
+                        # The staging tables of a failed load can outlive its rollback, as MySQL
+                        # and the default transaction handling of pysqlite do not undo their creation
+                        staging_table.drop(connection, checkfirst=True)
+                        staging_table.create(connection)
+                        staging[table.name] = (table, staging_table)
+                    self._stage_rows(connection, staging[table.name][1], rows, native)
+
+            deltas = {}
+            for table, staging_table in staging.values():
+                deltas.update(self._merge_staging_table(connection, table, staging_table))
+            if deltas:
+                self._update_counts(connection, deltas)
+            if self.graph_aware:
+                self._register_contexts(connection, contexts)
+            # PostgreSQL drops the staging tables on commit. They are not dropped
+            # after an error, which would hide it in an aborted PostgreSQL
+            # transaction: a rollback drops them, or else the next load does
+            if connection.dialect.name != "postgresql":
+                for _, staging_table in staging.values():
+                    staging_table.drop(connection)
+
+    def _bulk_rows(self, connection, quads, contexts, term_ids):
+        """
+        Encode quads as the rows of their statement tables.
+
+        Returns:
+            dict: mapping from statement table to the list of its rows, each a
+                tuple of the values of the columns of its staging table
+        """
+        params_lists = {}
+        for (table, _), (columns, rows) in self._build_statement_rows(quads, contexts).items():
+            params_lists[table] = [dict(zip(columns, row)) for row in rows]
+        self._encode_term_params(connection, [
+            params for params_list in params_lists.values() for params in params_list], term_ids)
+        rows = {}
+        for table, params_list in params_lists.items():
+            keys = [column.key for column in table.columns if column.key != "id"]
+            rows[table] = [tuple(term_text(params.get(key)) for key in keys) for params in params_list]
+        return rows
+
+    def _stage_rows(self, connection, staging_table, rows, native=True):
+        """Write rows to a staging table with the fastest method of the database."""
+        dialect = connection.dialect
+        preparer = dialect.identifier_preparer
+        table_name = preparer.format_table(staging_table)
+        column_names = ", ".join(preparer.quote(column.name) for column in staging_table.columns)
+
+        if native and dialect.name == "postgresql" and dialect.driver in ("psycopg2", "psycopg"):
+            sql = "COPY {} ({}) FROM STDIN".format(table_name, column_names)
+            cursor = connection.connection.cursor()
+            try:
+                if dialect.driver == "psycopg2":
+                    cursor.copy_expert(sql, io.StringIO(copy_text(rows)))
+                else:
+                    with cursor.copy(sql) as copy:
+                        copy.write(copy_text(rows))
+            finally:
+                cursor.close()
+        elif native and dialect.name == "mysql":
+            fd, path = tempfile.mkstemp(suffix=".tsv")
+            try:
+                with io.open(fd, "w", encoding="utf-8", newline="") as f:
+                    f.write(copy_text(rows))
+                connection.exec_driver_sql(
+                    "LOAD DATA LOCAL INFILE '{}' INTO TABLE {} CHARACTER SET utf8mb4 ({})".format(
+                        path.replace("\\", "/"), table_name, column_names))
+            finally:
+                os.remove(path)
+        elif dialect.name == "sqlite":
+            connection.exec_driver_sql("INSERT INTO {} ({}) VALUES ({})".format(
+                table_name, column_names, ", ".join("?" for _ in staging_table.columns)), rows)
+        else:
+            keys = [column.key for column in staging_table.columns]
+            connection.execute(staging_table.insert(), [dict(zip(keys, row)) for row in rows])
+
+    def _merge_staging_table(self, connection, table, staging_table):
+        """
+        Insert the rows of a staging table in its statement table, ignoring
+        the statements that exist already.
+
+        When the store maintains counts, the statements added to each context
+        are those returned by the insert where the dialect supports RETURNING,
+        and otherwise the row count of one insert for each staged context.
+
+        Returns:
+            dict: mapping from ``(context, partition)`` to the number of
+                statements added, when the store maintains counts
+        """
+        if not self.maintain_counts:
+            connection.execute(self._merge_statement(table, staging_table, expression.true()))
+            return {}
+
+        if connection.dialect.insert_returning:
+            added = connection.execute(
+                self._merge_statement(table, staging_table, expression.true()).returning(table.c.context)).fetchall()
+            counts = collections.Counter(context for context, in self._decode_term_ids(connection, added, (0,)))
+        else:
+            staged = connection.execute(select(staging_table.c.context).distinct()).scalars().all()
+            counts = dict(self._decode_term_ids(connection, [
+                (context, connection.execute(self._merge_statement(
+                    table, staging_table, staging_table.c.context == context)).rowcount)
+                for context in staged], (0,)))
+        partition = self._partition(table)
+        return dict(((context, partition), count) for context, count in counts.items())
+
+    def _merge_statement(self, table, staging_table, clause):
+        """Build the insert of the rows of a staging table matching ``clause`` in its statement table."""
+        # The WHERE clause keeps ON CONFLICT from being parsed as the ON of a join
+        return self._add_ignore_on_conflict(table.insert().from_select(
+            [column.key for column in staging_table.columns],
+            select(*staging_table.columns).where(clause)))
+
+
+@contextmanager
+def _quiet_index_reflection():
+    """Silence the warnings about the expression-based unique keys when ``checkfirst`` reflects the indexes."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", "Skipped unsupported reflection of expression-based index", SAWarning)
+        yield
+
+
+def _relax_pragmas(pragmas):
+    """Build the checkout listener setting SQLite PRAGMAs, saving the previous values on the connection record."""
+    def relax(dbapi_connection, connection_record, connection_proxy):
+        cursor = dbapi_connection.cursor()
+        try:
+            connection_record.info["bulk_mode_pragmas"] = [
+                (name, cursor.execute("PRAGMA {}".format(name)).fetchone()[0]) for name, _ in pragmas]
+            for name, value in pragmas:
+                cursor.execute("PRAGMA {} = {}".format(name, value))
+        finally:
+            cursor.close()
+    return relax
+
+
+def _reset_pragmas(dbapi_connection, connection_record):
+    """Reset the SQLite PRAGMAs changed by bulk mode on a connection checked in to the pool."""
+    pragmas = connection_record.info.pop("bulk_mode_pragmas", None)
+    if not pragmas or dbapi_connection is None:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute("PRAGMA {} = {}".format(name, value))
+    finally:
+        cursor.close()
@@ -0,0 +1,174 @@
+"""Maintained statement counts mixin"""
+from collections import defaultdict
+
+from rdflib.plugins.stores.regexmatching import REGEXTerm
+from sqlalchemy.sql import expression, functions
+
+from rdflib_sqlalchemy.constants import (
+    ASSERTED_LITERAL_PARTITION,
+    ASSERTED_NON_TYPE_PARTITION,
+    ASSERTED_TYPE_PARTITION,
+    QUOTED_PARTITION,
+)
+from rdflib_sqlalchemy.sql import statement_columns
+from rdflib_sqlalchemy.tables import hash_column
+from rdflib_sqlalchemy.types import term_hash, term_text
+
+
+PARTITION_TABLES = {
+    ASSERTED_NON_TYPE_PARTITION: "asserted_statements",
+    ASSERTED_TYPE_PARTITION: "type_statements",
+    QUOTED_PARTITION: "quoted_statements",
+    ASSERTED_LITERAL_PARTITION: "literal_statements",
+}
+''' Statement table of each partition '''
+
+
+class CountsMixin:
+    '''
+    Maintains the number of statements of each context and partition in
+    the ``statement_counts`` table, in the same transaction as the changes
+    to the statement tables, so that `len` does not have to scan them.
+    '''
+
+    def _partition(self, table):
+        """Return the partition of a statement table."""
+        for partition, name in PARTITION_TABLES.items():
+            if self.tables[name].name == table.name:
+                return partition
+        raise ValueError("Not a statement table: {}".format(table.name))
+
+    def _insert_counted_statements(self, connection, statement, params_list, context):
+        """
+        Execute an insert of statements of ``context``, ignoring the ones that
+        exist already, and return the number of statements actually inserted.
+
+        The number is the row count where the dialect reports it for
+        executemany, comes from RETURNING where the dialect supports it for
+        executemany, and is otherwise counted before and after the insert.
+        """
+        dialect = connection.dialect
+        if len(params_list) == 1 or dialect.supports_sane_multi_rowcount:
+            return connection.execute(statement, params_list).rowcount
+        elif dialect.insert_executemany_returning:
+            returning = statement.returning(statement.table.c.termComb)
+            return len(connection.execute(returning, params_list).all())
+
+        count = expression.select(functions.count()).select_from(statement.table).where(
+            self.build_term_clause(statement.table.c.context, context))
+        before = connection.execute(count).scalar()
+        connection.execute(statement, params_list)
+        return connection.execute(count).scalar() - before
+
+    def _delete_counted_statements(self, connection, table, clause, context):
+        """
+        Delete the statements of ``table`` matching ``clause`` and return a
+        dict mapping the text of each context to the number deleted from it.
+
+        With a single context the number is the row count of the delete,
+        otherwise the statements are counted by context before deleting them.
+        """
+        statement = table.delete()
+        if clause is not None:
+            statement = statement.where(clause)
+
+        if context is not None and not isinstance(context, REGEXTerm) and context.identifier is not None:
+            return {term_text(context.identifier): connection.execute(statement).rowcount}
+
+        q = expression.select(table.c.context, functions.count()).group_by(table.c.context)
+        if clause is not None:
+            q = q.where(clause)
+        deleted = dict(self._decode_term_ids(connection, connection.execute(q).fetchall(), (0,)))
+        connection.execute(statement)
+        return deleted
+
+    def _update_counts(self, connection, deltas):
+        """
+        Add ``deltas``, a dict mapping ``(context, partition)`` pairs to a
+        number of statements, to the maintained counts.
+
+        The row of a pair is created with a count of 0 first, ignoring a row
+        created concurrently, so that the counts are only ever changed by
+        relative updates.
+        """
+        counts = self.tables["statement_counts"]
+        for (context, partition), delta in deltas.items():
+            if not delta:
+                continue
+            row = {"context": context, "partition": partition, "statements": 0}
+            if self.hash_keys:
+                row[hash_column("context")] = term_hash(context)
+            connection.execute(self._add_ignore_on_conflict(counts.insert()), row)
+            connection.execute(
+                counts.update()
+                .where(self.build_term_clause(counts.c.context, context, False))
+                .where(counts.c.partition == partition)
+                .values(statements=counts.c.statements + delta))
+
+    def _counted_len(self, context=None):
+        """
+        Return the number of statements from the maintained counts.
+
+        Without a context this is the sum of the counts of every context in
+        the asserted partitions, so a triple asserted in several contexts is
+        counted once per context, as `_exact_len` counts it.
+        """
+        counts = self.tables["statement_counts"]
+        q = expression.select(functions.coalesce(functions.sum(counts.c.statements), 0))
+        if context is not None:
+            q = q.where(self.build_term_clause(counts.c.context, term_text(context.identifier), False))
+        else:
+            q = q.where(counts.c.partition != QUOTED_PARTITION)
+        with self.engine.connect() as connection:
+            return int(connection.execute(q).scalar())
+
+    def verify_counts(self, repair=False):
+        """
+        Compare the maintained counts with the statement tables.
+
+        Counts the distinct statements of every partition of every context with a
+        full scan, and the length of the store as `len` does without maintained
+        counts. Use it to check the counts, or with ``repair`` to (re)build
+        them, e.g. after enabling `maintain_counts` on an existing store.
+
+        Args:
+            repair (bool): Whether to replace the maintained counts by the
+                actual ones
+
+        Returns:
+            dict: mapping from ``(context, partition)`` to a ``(counted, actual)``
+                pair, for every count that is wrong, and from None to the
+                ``(counted, actual)`` length of the store if it is wrong
+        """
+        counts = self.tables["statement_counts"]
+        exact_len = self._exact_len()
+        with self.engine.begin() as connection:
+            actual = defaultdict(int)
+            for partition, name in PARTITION_TABLES.items():
+                table = self.tables[name]
+                statements = expression.select(
+                    table.c.context, *statement_columns(table, partition)).distinct().subquery()
+                q = expression.select(statements.c.context, functions.count()).group_by(statements.c.context)
+                rows = self._decode_term_ids(connection, connection.execute(q).fetchall(), (0,))
+                for context, count in rows:
+                    actual[(context, partition)] = count
+
+            counted = dict(
+                ((context, partition), statements)
+                for context, partition, statements in connection.execute(
+                    expression.select(counts.c.context, counts.c.partition, counts.c.statements))
+            )
+
+            mismatches = dict(
+                (key, (counted.get(key, 0), actual.get(key, 0)))
+                for key in set(actual) | set(counted)
+                if counted.get(key, 0) != actual.get(key, 0)
+            )
+            counted_len = sum(
+                statements for (_, partition), statements in counted.items() if partition != QUOTED_PARTITION)
+            if counted_len != exact_len:
+                mismatches[None] = (counted_len, exact_len)
+            if repair and mismatches:
+                connection.execute(counts.delete())
+                self._update_counts(connection, actual)
+        return mismatches
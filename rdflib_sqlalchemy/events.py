@@ -0,0 +1,14 @@
+"""Events dispatched by the store."""
+from rdflib.events import Event
+
+
+class TriplesAddedEvent(Event):
+    """
+    The addition of a chunk of quads by `SQLAlchemy.addN` or `SQLAlchemy.bulk_load`.
+
+    Subscribe to it instead of `rdflib.store.TripleAddedEvent` to be notified
+    once per chunk rather than once per quad.
+
+    Attributes:
+        quads (list): the ``(subject, predicate, object, context)`` quads of the chunk
+    """
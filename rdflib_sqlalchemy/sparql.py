@@ -0,0 +1,493 @@
+"""SPARQL evaluation hooks that push query algebra down into SQL."""
+from decimal import Decimal
+
+from rdflib import BNode, Literal, URIRef, Variable
+from rdflib.graph import ConjunctiveGraph
+from rdflib.namespace import RDF, XSD
+from rdflib.plugins.sparql import CUSTOM_EVALS
+from rdflib.plugins.sparql.evalutils import _ebv
+from six import text_type
+from sqlalchemy import types
+from sqlalchemy.sql import expression, functions
+
+from rdflib_sqlalchemy.constants import (
+    REVERSE_TERM_COMBINATIONS,
+    TERM_COMBINATIONS,
+    TRIPLE_SELECT_NO_ORDER,
+)
+from rdflib_sqlalchemy.sql import union_select
+from rdflib_sqlalchemy.termutils import create_term
+
+__all__ = ["register_custom_eval", "custom_eval"]
+
+
+CUSTOM_EVAL_NAME = "rdflib_sqlalchemy"
+
+# Positions of the columns in a compiled triple pattern
+SUBJECT = 0
+PREDICATE = 1
+OBJECT = 2
+OBJ_LANGUAGE = 3
+OBJ_DATATYPE = 4
+TERM_COMB = 5
+PATTERN_WIDTH = 6
+
+# Positions of the columns in the rows produced by `union_select`
+UNION_COLUMNS = (1, 2, 3, 6, 7)
+UNION_TERM_COMB = 5
+
+INTEGER_DATATYPES = [text_type(datatype) for datatype in (
+    XSD.integer, XSD.nonPositiveInteger, XSD.negativeInteger, XSD.long, XSD.int,
+    XSD.short, XSD.byte, XSD.nonNegativeInteger, XSD.unsignedLong,
+    XSD.unsignedInt, XSD.unsignedShort, XSD.unsignedByte,
+    XSD.positiveInteger,
+)]
+
+FLOATING_POINT_DATATYPES = [text_type(XSD.float), text_type(XSD.double)]
+
+NUMERIC_DATATYPES = INTEGER_DATATYPES + [text_type(XSD.decimal)] + FLOATING_POINT_DATATYPES
+
+NUMERIC_LEXICAL_PATTERNS = (
+    (INTEGER_DATATYPES, r"^[ \t\r\n]*[+-]?[0-9]+[ \t\r\n]*$"),
+    ([text_type(XSD.decimal)], r"^[ \t\r\n]*[+-]?([0-9]+(\.[0-9]*)?|\.[0-9]+)[ \t\r\n]*$"),
+    (FLOATING_POINT_DATATYPES, r"^[ \t\r\n]*[+-]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][+-]?[0-9]+)?[ \t\r\n]*$"),
+)
+''' Lexical forms of the numeric datatypes that every database casts to a number, apart from
+the INF and -INF of the floating point datatypes '''
+
+INFINITIES = ((("INF", "+INF", "inf"), float("inf")), (("-INF", "-inf"), float("-inf")))
+''' Lexical forms of the infinities of the floating point datatypes, as written and as normalized by rdflib '''
+
+SAFE_DIGITS = 15
+''' Numbers of at most this many significant digits keep their order when converted to double precision '''
+
+COMPARISON_OPERATORS = {
+    "=": lambda a, b: a == b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+}
+
+REVERSED_OPERATORS = {"=": "=", "<": ">", ">": "<", "<=": ">=", ">=": "<="}
+
+LOOSE_OPERATORS = {"=": "=", "<": "<=", ">": ">=", "<=": "<=", ">=": ">="}
+
+
+def register_custom_eval():
+    """Register `custom_eval` with the rdflib SPARQL engine (idempotent)."""
+    CUSTOM_EVALS[CUSTOM_EVAL_NAME] = custom_eval
+
+
+def custom_eval(ctx, part):
+    """
+    Evaluate a part of the SPARQL algebra against a SQLAlchemy store.
+
+    Only basic graph patterns, optionally wrapped in a filter, over a store
+    with `sparql_pushdown` enabled are handled; for everything else
+    NotImplementedError is raised, which tells rdflib to fall back to its own
+    evaluation.
+    """
+    if part.name == "BGP":
+        store = _pushdown_store(ctx, part)
+        return evalBGP(ctx, store, part.triples)
+    elif part.name == "Filter" and part.p.name == "BGP":
+        store = _pushdown_store(ctx, part.p)
+        return evalFilter(ctx, store, part)
+    raise NotImplementedError()
+
+
+def evalBGP(ctx, store, triples):
+    """
+    Evaluate a basic graph pattern with one SQL statement.
+
+    Each triple pattern is compiled into a DISTINCT select over the partitions
+    it may match, and the patterns are joined on the columns their shared
+    variables occupy.
+    """
+    patterns = _patterns(ctx, triples)
+    q, _ = compile_bgp(store, patterns, _graph_context(ctx.graph))
+    return _solutions(ctx, store, q, patterns)
+
+
+def evalFilter(ctx, store, part):
+    """
+    Evaluate a filtered basic graph pattern.
+
+    The conjuncts of the filter that `translate_filter` understands become
+    part of the WHERE clause; only the remaining ones are evaluated by rdflib
+    on the decoded solutions, along with the partially translated ones on
+    the rows SQL could not decide exactly, which are flagged by extra columns.
+    """
+    patterns = _patterns(ctx, part.p.triples)
+    q, variables = compile_bgp(store, patterns, _graph_context(ctx.graph))
+    clauses, residual, partial = translate_filter(part.expr, variables, store)
+    if clauses:
+        q = q.where(expression.and_(*clauses))
+    if partial:
+        q = q.add_columns(*[
+            expression.case((exact, 1), else_=0).label("exact%d" % index)
+            for index, (exact, _) in enumerate(partial)])
+    flags = len(patterns) * PATTERN_WIDTH
+    for rt, c in _row_solutions(ctx, store, q, patterns):
+        scope = c if part.no_isolated_scope else c.forget(ctx, _except=part._vars)
+        rechecked = [expr for index, (_, expr) in enumerate(partial) if not rt[flags + index]]
+        if all(_ebv(expr, scope) for expr in residual + rechecked):
+            yield c
+
+
+def compile_bgp(store, patterns, context):
+    """
+    Compile a list of ``(bound_triple, variables)`` pairs into one select.
+
+    ``variables`` lists the ``(position, variable)`` pairs of a pattern that
+    are left unbound. Variables shared between positions are turned into
+    column equalities. Because the columns only hold the lexical form of a
+    term, the equalities are re-checked on the decoded terms afterwards.
+
+    Returns the select and a dict mapping each variable to the list of
+    ``(pattern_columns, position)`` pairs it occupies.
+    """
+    aliases = []
+    columns = []
+    variables = {}
+    joins = []
+    for index, (bound, pattern_variables) in enumerate(patterns):
+        alias = _pattern_select(store, bound, context).subquery("t%d" % index)
+        aliases.append(alias)
+        alias_columns = list(alias.c)
+        columns.extend(
+            column.label("t%d_%d" % (index, position))
+            for position, column in enumerate(alias_columns))
+
+        conditions = []
+        for position, var in pattern_variables:
+            if var in variables:
+                first_columns, first_position = variables[var][0]
+                conditions.append(alias_columns[position] == first_columns[first_position])
+            variables.setdefault(var, []).append((alias_columns, position))
+        joins.append(conditions)
+
+    from_clause = aliases[0]
+    for alias, conditions in zip(aliases[1:], joins[1:]):
+        from_clause = from_clause.join(
+            alias,
+            expression.and_(*conditions) if conditions else expression.true())
+
+    q = expression.select(*columns).select_from(from_clause)
+    if joins[0]:
+        q = q.where(expression.and_(*joins[0]))
+    return q, variables
+
+
+def translate_filter(expr, variables, store):
+    """
+    Translate a filter expression into SQL clauses.
+
+    The expression is split into its conjuncts. Returns the list of clauses
+    for the conjuncts that could be translated, the list of conjuncts that
+    could not or only as a prefilter, which must still be evaluated in
+    Python, and a list of ``(exact, conjunct)`` pairs for the conjuncts that
+    must only be evaluated in Python on the rows where the clause ``exact``
+    does not hold.
+    """
+    clauses = []
+    residual = []
+    partial = []
+    for conjunct in _conjuncts(expr):
+        clause, exact = _translate(conjunct, variables, store)
+        if clause is not None:
+            clauses.append(clause)
+        if isinstance(exact, expression.ColumnElement):
+            partial.append((exact, conjunct))
+        elif not exact:
+            residual.append(conjunct)
+    return clauses, residual, partial
+
+
+def _conjuncts(expr):
+    if getattr(expr, "name", None) == "ConditionalAndExpression":
+        result = _conjuncts(expr.expr)
+        for other in expr.other:
+            result.extend(_conjuncts(other))
+        return result
+    return [expr]
+
+
+def _translate(expr, variables, store):
+    """
+    Translate one filter expression.
+
+    Returns a ``(clause, exact)`` pair: the clause is None if the expression
+    is unsupported, and is only a prefilter, to be rechecked in Python, unless
+    ``exact``, which may also be a clause holding on the rows the clause
+    decides exactly. Text comparisons are not exact on MySQL, whose default
+    collations ignore case.
+    """
+    name = getattr(expr, "name", None)
+    case_sensitive = store.engine.name != "mysql"
+    if name == "RelationalExpression":
+        return _translate_relational(expr, variables, store, case_sensitive)
+    elif name == "Builtin_STRSTARTS":
+        string = _string_column(expr.arg1, variables)
+        if string is None or not _is_plain_string(expr.arg2):
+            return None, False
+        condition, column = string
+        prefix = text_type(expr.arg2)
+        text = store.build_term_text(column)
+        # LIKE ignores case on SQLite; it is kept as it can use an index elsewhere
+        return expression.and_(
+            condition,
+            text.startswith(prefix, autoescape=True),
+            functions.func.substr(text, 1, len(prefix)) == prefix,
+        ), case_sensitive
+    elif name == "Builtin_REGEX":
+        string = _string_column(expr.text, variables)
+        if string is None or expr.flags or not _is_plain_string(expr.pattern):
+            return None, False
+        condition, column = string
+        return expression.and_(condition, store.build_regexp_clause(column, expr.pattern)), case_sensitive
+    return None, False
+
+
+def _translate_relational(expr, variables, store, case_sensitive):
+    op = expr.op
+    left, right = expr.expr, expr.other
+    if op not in COMPARISON_OPERATORS:
+        return None, False
+
+    if isinstance(right, Variable) and isinstance(left, Literal):
+        left, right, op = right, left, REVERSED_OPERATORS[op]
+
+    if isinstance(left, Variable) and _is_numeric(right):
+        number = right.toPython()
+        if left not in variables or not isinstance(number, (int, float, Decimal)):
+            return None, False
+        pattern = _object_columns(left, variables)
+        if pattern is None:
+            # Only literals can be compared with numbers
+            return expression.false(), True
+        return _numeric_comparison(store, pattern, op, number)
+
+    if op != "=" or not isinstance(getattr(left, "arg", None), Variable):
+        return None, False
+
+    name = getattr(left, "name", None)
+    var = left.arg
+    if var not in variables:
+        return None, False
+    pattern = _object_columns(var, variables)
+    if name == "Builtin_LANG" and _is_plain_string(right) and text_type(right):
+        if pattern is None:
+            # Only literals have a language
+            return expression.false(), True
+        return pattern[OBJ_LANGUAGE] == text_type(right), case_sensitive
+    elif name == "Builtin_DATATYPE" and isinstance(right, URIRef) \
+            and right not in (XSD.string, RDF.langString):
+        # Plain and language-tagged literals are stored without a datatype,
+        # so those two datatypes are left to rdflib
+        if pattern is None:
+            return expression.false(), True
+        return pattern[OBJ_DATATYPE] == text_type(right), case_sensitive
+    return None, False
+
+
+def _numeric_comparison(store, pattern, op, number):
+    """
+    Build the comparison of the numeric literals of a pattern with a number.
+
+    Literals whose lexical form is not valid for their datatype are
+    ill-typed and compare as false. The cast is guarded so that it is never
+    applied to them (nor to non-numeric text), whatever order the database
+    evaluates the conditions in. INF and -INF are compared here instead.
+
+    The literals are compared in double precision, which decides the
+    comparison exactly for floating point literals if ``number`` is a double,
+    and for the other literals if both they and ``number`` have at most
+    `SAFE_DIGITS` significant digits. The other literals are only prefiltered,
+    with the operator made non-strict as rounding may make them equal to
+    ``number``, so the comparison is returned with the clause on which it is
+    exact.
+    """
+    compare = COMPARISON_OPERATORS[op]
+    datatype = pattern[OBJ_DATATYPE]
+    text = store.build_term_text(pattern[OBJECT])
+    well_formed = expression.or_(*[
+        expression.and_(datatype.in_(datatypes), text.regexp_match(lexical_pattern))
+        for datatypes, lexical_pattern in NUMERIC_LEXICAL_PATTERNS
+    ])
+    value = expression.case((well_formed, expression.cast(text, types.Double)), else_=expression.null())
+
+    exact_number = Decimal(float(number)) == Decimal(number)
+    if not exact_number:
+        exact = expression.false()
+    elif len(Decimal(number).normalize().as_tuple().digits) > SAFE_DIGITS:
+        exact = datatype.in_(FLOATING_POINT_DATATYPES)
+    else:
+        # Counting the sign and the decimal point, and any leading zeros, errs on the safe side
+        exact = expression.or_(datatype.in_(FLOATING_POINT_DATATYPES),
+                               functions.func.length(text) <= SAFE_DIGITS)
+    clauses = [expression.and_(well_formed, expression.or_(
+        expression.and_(exact, compare(value, float(number))),
+        expression.and_(expression.not_(exact), COMPARISON_OPERATORS[LOOSE_OPERATORS[op]](value, float(number))),
+    ))]
+    infinities = [lexical for lexicals, infinity in INFINITIES if compare(infinity, number) for lexical in lexicals]
+    if infinities:
+        clauses.append(expression.and_(datatype.in_(FLOATING_POINT_DATATYPES), text.in_(infinities)))
+    return expression.or_(*clauses), expression.or_(exact, text.in_([
+        lexical for lexicals, _ in INFINITIES for lexical in lexicals]))
+
+
+def _string_column(arg, variables):
+    """
+    Return a ``(condition, column)`` pair for a string argument of a function.
+
+    ``STR(?x)`` is the lexical form of any term, while a bare ``?x`` must be
+    a literal without a datatype other than xsd:string.
+    """
+    if getattr(arg, "name", None) == "Builtin_STR":
+        arg, any_term = arg.arg, True
+    else:
+        any_term = False
+    if not isinstance(arg, Variable) or arg not in variables:
+        return None
+
+    pattern_columns, position = variables[arg][0]
+    if any_term:
+        return expression.true(), pattern_columns[position]
+    pattern = _object_columns(arg, variables)
+    if pattern is None:
+        return expression.false(), pattern_columns[position]
+    datatype = pattern[OBJ_DATATYPE]
+    return expression.and_(
+        _term_type_clause(pattern[TERM_COMB], OBJECT, "L"),
+        expression.or_(datatype.is_(None), datatype == text_type(XSD.string)),
+    ), pattern[OBJECT]
+
+
+def _object_columns(var, variables):
+    """Return the columns of a pattern ``var`` is the object of, if any."""
+    for pattern_columns, position in variables[var]:
+        if position == OBJECT:
+            return pattern_columns
+    return None
+
+
+def _term_type_clause(term_comb, position, letter):
+    """Build a clause restricting the term type of a position of a pattern."""
+    return term_comb.in_(sorted(
+        value for key, value in TERM_COMBINATIONS.items()
+        if key[position] == letter and key[-1] == "U"
+    ))
+
+
+def _is_numeric(term):
+    return isinstance(term, Literal) and term.datatype is not None \
+        and text_type(term.datatype) in NUMERIC_DATATYPES
+
+
+def _is_plain_string(term):
+    return isinstance(term, Literal) and term.language is None \
+        and term.datatype in (None, XSD.string)
+
+
+def _patterns(ctx, triples):
+    patterns = []
+    for triple in triples:
+        bound = tuple(ctx[term] for term in triple)
+        variables = [
+            (position, term)
+            for position, term in enumerate(triple)
+            if bound[position] is None
+        ]
+        patterns.append((bound, variables))
+    return patterns
+
+
+def _solutions(ctx, store, q, patterns):
+    for _, solution in _row_solutions(ctx, store, q, patterns):
+        yield solution
+
+
+def _row_solutions(ctx, store, q, patterns):
+    """Yield the result rows of ``q`` with their solutions, skipping the rows whose bindings clash."""
+    term_positions = [
+        index * PATTERN_WIDTH + position
+        for index in range(len(patterns))
+        for position in (SUBJECT, PREDICATE, OBJECT)
+    ]
+    for rt in store._select_rows(q, term_positions):
+        bindings = _row_bindings(rt, patterns, store)
+        if bindings is None:
+            continue
+        c = ctx.push()
+        for var, value in bindings.items():
+            c[var] = value
+        yield rt, c.solution()
+
+
+def _pattern_select(store, triple, context):
+    """
+    Build the select of the distinct statements matching one triple pattern.
+
+    The context letter is dropped from the term combination (every third
+    combination differs only in the context letter) so that a statement found
+    in several contexts is only matched once, as it is by `triples`.
+    """
+    selects = store._triples_helper(triple, context)
+    sub = union_select(selects, select_type=TRIPLE_SELECT_NO_ORDER,
+                       type_predicate=store._type_predicate()).subquery()
+    sub_columns = list(sub.c)
+    term_comb = sub_columns[UNION_TERM_COMB]
+    return expression.select(
+        *[sub_columns[i] for i in UNION_COLUMNS] +
+        [(term_comb - term_comb % 3).label("termcomb")]
+    ).distinct()
+
+
+def _row_bindings(rt, patterns, store):
+    """Decode the variable bindings of a result row, or None if they clash."""
+    bindings = {}
+    for index, (_, variables) in enumerate(patterns):
+        base = index * PATTERN_WIDTH
+        if not variables:
+            continue
+        term_comb = REVERSE_TERM_COMBINATIONS[rt[base + TERM_COMB]]
+        for position, var in variables:
+            if position == OBJECT:
+                value = create_term(
+                    rt[base + OBJECT], term_comb[OBJECT], store,
+                    rt[base + OBJ_LANGUAGE], rt[base + OBJ_DATATYPE])
+            else:
+                value = create_term(rt[base + position], term_comb[position], store)
+            if var in bindings:
+                if bindings[var] != value:
+                    return None
+            else:
+                bindings[var] = value
+    return bindings
+
+
+def _pushdown_store(ctx, bgp):
+    """Return the store to evaluate ``bgp`` with, or raise NotImplementedError."""
+    graph = ctx.graph
+    store = graph is not None and graph.store
+    if (not getattr(store, "sparql_pushdown", False)
+            or not bgp.triples or not _compilable(bgp.triples)):
+        raise NotImplementedError()
+    return store
+
+
+def _compilable(triples):
+    return all(
+        isinstance(term, (URIRef, BNode, Literal, Variable))
+        for triple in triples
+        for term in triple
+    )
+
+
+def _graph_context(graph):
+    """Return the context `triples` would be called with for ``graph``."""
+    if isinstance(graph, ConjunctiveGraph):
+        return None if graph.default_union else graph.default_context
+    return graph
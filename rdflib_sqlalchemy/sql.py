@@ -1,6 +1,12 @@
+import re
+from functools import lru_cache
+
 from rdflib.namespace import RDF
 from six import text_type
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql import expression, functions
+from sqlalchemy.sql.visitors import InternalTraversal
 
 from rdflib_sqlalchemy.constants import (
     ASSERTED_TYPE_PARTITION,
@@ -14,6 +20,37 @@ from rdflib_sqlalchemy.constants import (
 )
 
 
+REGEXP_CACHE_SIZE = 256
+''' Number of compiled patterns kept by the SQLite REGEXP function '''
+
+
+class BinaryOrder(expression.ColumnElement):
+    """
+    Order by a column comparing its values byte by byte.
+
+    Rows that are merged because they are adjacent in the result have to be
+    ordered on their exact values: the case-insensitive collations of MySQL
+    would put rows differing only in case between the rows of one triple.
+    The other databases compare text byte by byte (or break ties that way).
+    """
+
+    inherit_cache = True
+    _traverse_internals = [("column", InternalTraversal.dp_clauseelement)]
+
+    def __init__(self, column):
+        self.column = column
+
+
+@compiles(BinaryOrder)
+def _compile_binary_order(element, compiler, **kw):
+    return compiler.process(element.column, **kw)
+
+
+@compiles(BinaryOrder, "mysql")
+def _compile_mysql_binary_order(element, compiler, **kw):
+    return "BINARY " + compiler.process(element.column, **kw)
+
+
 def query_analysis(query, store, connection):
     """
     Helper function.
@@ -39,7 +76,23 @@ def query_analysis(query, store, connection):
     store.queryOptMarks[(_key, table)] = hits + 1
 
 
-def union_select(select_components, distinct=False, select_type=TRIPLE_SELECT):
+def statement_columns(table, tableType):
+    """
+    Return the columns telling apart the statements of a partition, apart
+    from their context: a statement is counted once for each distinct value.
+    """
+    c = table.c
+    if tableType == ASSERTED_TYPE_PARTITION:
+        return [c.member, c.klass]
+    elif tableType == ASSERTED_NON_TYPE_PARTITION:
+        return [c.subject, c.predicate, c.object]
+    elif tableType in (ASSERTED_LITERAL_PARTITION, QUOTED_PARTITION):
+        return [c.subject, c.predicate, c.object, c.objLanguage, c.objDatatype]
+    raise ValueError('Unrecognized table type {}'.format(tableType))
+
+
+def union_select(select_components, distinct=False, select_type=TRIPLE_SELECT, type_predicate=None,
+                 limit=None, after=None):
     """
     Helper function for building union all select statement.
 
@@ -49,56 +102,187 @@ def union_select(select_components, distinct=False, select_type=TRIPLE_SELECT):
         distinct (bool): Whether to eliminate duplicate results
         select_type (int): From `rdflib_sqlalchemy.constants`. Either `.COUNT_SELECT`,
             `.CONTEXT_SELECT`, `.TRIPLE_SELECT`
+        type_predicate: The expression selected as the predicate of the rows of the
+            rdf:type partition. Defaults to the text of rdf:type; a dictionary-encoded
+            store passes the id of rdf:type instead.
+        limit (int): For a `.CONTEXT_SELECT`, select a page of at most ``limit``
+            contexts, in order
+        after: For a page of contexts, the last context of the previous page
 
     """
+    if type_predicate is None:
+        type_predicate = expression.literal(text_type(RDF.type))
     selects = []
     for table, whereClause, tableType in select_components:
 
         if select_type == COUNT_SELECT:
-            c = table.c
-            if tableType == ASSERTED_TYPE_PARTITION:
-                cols = [c.member, c.klass]
-            elif tableType in (ASSERTED_LITERAL_PARTITION, ASSERTED_NON_TYPE_PARTITION, QUOTED_PARTITION):
-                cols = [c.subject, c.predicate, c.object]
-            else:
-                raise ValueError('Unrecognized table type {}'.format(tableType))
-            select_clause = expression.select(*[functions.count().label('aCount')]).select_from(
-                expression.select(*cols).where(whereClause).distinct().select_from(table))
-        elif select_type == CONTEXT_SELECT:
-            select_clause = expression.select(table.c.context)
+            counted = expression.select(
+                table.c.context, *statement_columns(table, tableType)).distinct().select_from(table)
             if whereClause is not None:
-                select_clause = expression.select(table.c.context).where(whereClause)
-        elif tableType in FULL_TRIPLE_PARTITIONS:
-            select_clause = table.select().where(whereClause)
+                counted = counted.where(whereClause)
+            select_clause = expression.select(*[functions.count().label('aCount')]).select_from(counted)
+        elif select_type == CONTEXT_SELECT:
+            select_clause = _context_select(table, whereClause, limit, after)
         elif tableType == ASSERTED_TYPE_PARTITION:
-            select_clause = expression.select(
-                *[table.c.id.label("id"),
-                 table.c.member.label("subject"),
-                 expression.literal(text_type(RDF.type)).label("predicate"),
-                 table.c.klass.label("object"),
-                 table.c.context.label("context"),
-                 table.c.termComb.label("termcomb"),
-                 expression.literal_column("NULL").label("objlanguage"),
-                 expression.literal_column("NULL").label("objdatatype")]).where(
-                whereClause)
-        elif tableType == ASSERTED_NON_TYPE_PARTITION:
-            all_table_columns = [c for c in table.columns] + \
-                                [expression.literal_column("NULL").label("objlanguage"),
-                                 expression.literal_column("NULL").label("objdatatype")]
+            select_clause = _type_partition_select(table, whereClause, type_predicate)
+        else:
+            select_clause = expression.select(*_triple_columns(table, tableType)).select_from(table)
             if whereClause is not None:
-                select_clause = expression.select(*all_table_columns).select_from(table).where(whereClause)
-            else:
-                select_clause = expression.select(*all_table_columns).select_from(table)
+                select_clause = select_clause.where(whereClause)
         selects.append(select_clause)
 
     order_statement = []
     if select_type == TRIPLE_SELECT:
+        # Ordering on the language, datatype and term combination as well keeps
+        # every row of a triple adjacent, even when another triple has the same
+        # lexical forms but different term types
         order_statement = [
-            expression.literal_column("subject"),
-            expression.literal_column("predicate"),
-            expression.literal_column("object"),
-        ]
+            BinaryOrder(expression.literal_column(column))
+            for column in ("subject", "predicate", "object", "objlanguage", "objdatatype")
+        ] + [expression.literal_column("termcomb")]
+    elif select_type == CONTEXT_SELECT and limit is not None:
+        return expression.union(*selects).order_by(expression.literal_column("context")).limit(limit)
     if distinct and select_type != COUNT_SELECT:
         return expression.union(*selects).order_by(*order_statement)
     else:
         return expression.union_all(*selects).order_by(*order_statement)
+
+
+def partitions_overlap(select_components):
+    """
+    Return whether the rows selected from different partitions can coincide.
+
+    The asserted partitions hold different statements: those with a literal
+    object, the rdf:type statements with a non-literal class, and the rest.
+    Only the quoted partition can hold a statement of another partition, so
+    a union needs to eliminate duplicates when it includes it, or when it
+    selects from a partition more than once (e.g. for each group of the
+    choices of `triples_choices`, which may repeat a term).
+    """
+    table_types = [tableType for _, _, tableType in select_components]
+    return (QUOTED_PARTITION in table_types and len(table_types) > 1) or len(set(table_types)) < len(table_types)
+
+
+def term_select(select_components, position, type_predicate=None):
+    """
+    Build a select of the distinct terms at one position of the matching triples.
+
+    Only the term column is selected, with the term combination and, for
+    literal objects, the language and datatype needed to decode it.
+
+    Args:
+        select_components (iterable of tuples): As for `union_select`
+        position (str): "subject", "predicate" or "object"
+        type_predicate: As for `union_select`
+    """
+    if type_predicate is None:
+        type_predicate = expression.literal(text_type(RDF.type))
+    selects = []
+    for table, whereClause, tableType in select_components:
+        if tableType == ASSERTED_TYPE_PARTITION:
+            column = {"subject": table.c.member, "predicate": type_predicate, "object": table.c.klass}[position]
+        else:
+            column = table.c[position]
+        if position == "object" and tableType in FULL_TRIPLE_PARTITIONS:
+            literal_columns = [table.c.objLanguage.label("objlanguage"), table.c.objDatatype.label("objdatatype")]
+        else:
+            literal_columns = [expression.literal_column("NULL").label("objlanguage"),
+                               expression.literal_column("NULL").label("objdatatype")]
+        select_clause = expression.select(column.label("term"), table.c.termComb.label("termcomb"), *literal_columns)
+        if whereClause is not None:
+            select_clause = select_clause.where(whereClause)
+        selects.append(select_clause)
+    return expression.union(*selects)
+
+
+def _context_select(table, whereClause, limit=None, after=None):
+    """Select the contexts of a table, or the first ``limit`` of them following ``after``."""
+    select_clause = expression.select(table.c.context)
+    if whereClause is not None:
+        select_clause = select_clause.where(whereClause)
+    if after is not None:
+        select_clause = select_clause.where(table.c.context > after)
+    if limit is not None:
+        # Each table is limited too, so that a page reads no more than a page
+        # from each index; a member of a compound select is only limited as a subquery
+        page = select_clause.distinct().order_by(table.c.context).limit(limit).subquery()
+        select_clause = expression.select(page.c.context)
+    return select_clause
+
+
+def _id_column(table):
+    """Select the id of the statements, or NULL for the tables of a lean schema, which have none."""
+    if "id" in table.c:
+        return table.c.id.label("id")
+    return expression.literal_column("NULL").label("id")
+
+
+def _triple_columns(table, tableType):
+    """
+    List the columns selected from a statement table.
+
+    The columns are named explicitly, rather than selecting the whole table,
+    so that columns only used for indexing never reach the union.
+    """
+    c = table.c
+    columns = [_id_column(table), c.subject, c.predicate, c.object, c.context, c.termComb]
+    if tableType in FULL_TRIPLE_PARTITIONS:
+        columns += [c.objLanguage, c.objDatatype]
+    elif tableType == ASSERTED_NON_TYPE_PARTITION:
+        columns += [expression.literal_column("NULL").label("objlanguage"),
+                    expression.literal_column("NULL").label("objdatatype")]
+    else:
+        raise ValueError('Unrecognized table type {}'.format(tableType))
+    return columns
+
+
+def _type_partition_select(table, whereClause, type_predicate):
+    """Select the rows of the rdf:type partition in the layout of the other partitions."""
+    select_clause = expression.select(
+        *[_id_column(table),
+          table.c.member.label("subject"),
+          type_predicate.label("predicate"),
+          table.c.klass.label("object"),
+          table.c.context.label("context"),
+          table.c.termComb.label("termcomb"),
+          expression.literal_column("NULL").label("objlanguage"),
+          expression.literal_column("NULL").label("objdatatype")])
+    if whereClause is not None:
+        select_clause = select_clause.where(whereClause)
+    return select_clause
+
+
+@lru_cache(maxsize=REGEXP_CACHE_SIZE)
+def _compile_regexp(pattern):
+    return re.compile(pattern)
+
+
+def sqlite_regexp(pattern, value):
+    """Implementation of the SQLite ``X REGEXP Y`` operator, i.e. ``regexp(Y, X)``."""
+    if value is None:
+        return None
+    return _compile_regexp(pattern).search(value) is not None
+
+
+def _set_sqlite_regexp(dbapi_connection, connection_record):
+    dbapi_connection.create_function("regexp", 2, sqlite_regexp)
+    connection_record.info["sqlite_regexp"] = True
+
+
+def _check_sqlite_regexp(dbapi_connection, connection_record, connection_proxy):
+    if not connection_record.info.get("sqlite_regexp"):
+        _set_sqlite_regexp(dbapi_connection, connection_record)
+
+
+def register_sqlite_regexp(engine):
+    """
+    Make REGEXP available on the connections of a SQLite engine.
+
+    SQLite parses the REGEXP operator but leaves its implementation to the
+    application. The function is registered on every new connection, and on
+    the connections already in the pool when they are checked out, and keeps
+    a cache of compiled patterns. Engines of other dialects are left alone.
+    """
+    if engine.name == "sqlite" and not event.contains(engine, "connect", _set_sqlite_regexp):
+        event.listen(engine, "connect", _set_sqlite_regexp)
+        event.listen(engine, "checkout", _check_sqlite_regexp)
@@ -1,6 +1,56 @@
 """Statistical summary of store statements mixin"""
 from sqlalchemy.orm.session import Session
-from sqlalchemy.sql import func
+from sqlalchemy.sql import bindparam, func, text
+
+
+ASSERTED_TABLES = ("asserted_statements", "type_statements", "literal_statements")
+''' Tables of the partitions counted by `len` '''
+
+
+def get_catalog_row_counts(connection, table_names):
+    """
+    Read the estimated number of rows of tables from the statistics of the database.
+
+    The estimates come from ``pg_class.reltuples`` on PostgreSQL,
+    ``information_schema.TABLES.TABLE_ROWS`` on MySQL and ``sqlite_stat1``
+    on SQLite, and are only as recent as the last ANALYZE (or, on MySQL,
+    the last update of the InnoDB statistics).
+
+    Args:
+        connection (~sqlalchemy.engine.Connection): connection to query with
+        table_names (list of str): names of the tables
+
+    Returns:
+        dict: dictionary mapping from table name to estimated number of rows, for
+            the tables that have statistics
+    """
+    name = connection.dialect.name
+    if name == "postgresql":
+        q = text(
+            "SELECT relname, reltuples FROM pg_class "
+            "WHERE relname IN :names AND relkind = 'r' AND pg_table_is_visible(oid)")
+    elif name == "mysql":
+        q = text(
+            "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN :names")
+    elif name == "sqlite":
+        if connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")).first() is None:
+            return {}
+        # The first number of the stat column of each index is the number of rows of its table
+        q = text("SELECT tbl, stat FROM sqlite_stat1 WHERE tbl IN :names")
+    else:
+        return {}
+
+    counts = {}
+    for table_name, rows in connection.execute(
+            q.bindparams(bindparam("names", expanding=True)), {"names": list(table_names)}):
+        if isinstance(rows, str):
+            rows = rows.split()[0]
+        # PostgreSQL reports -1 for a table that has not been analyzed yet
+        if rows is not None and float(rows) >= 0:
+            counts[table_name] = max(counts.get(table_name, 0), int(float(rows)))
+    return counts
 
 
 def get_group_by_count(session, group_by_column):
@@ -24,25 +74,76 @@ def get_group_by_count(session, group_by_column):
 
 class StatisticsMixin:
     ''' Has methods for statistics on stores '''
-    def statistics(self, asserted_statements=True, literals=True, types=True):
-        """Store statistics."""
+    def statistics(self, asserted_statements=None, literals=None, types=None, approximate=False):
+        """
+        Store statistics.
+
+        The counts by predicate of the asserted and literal statements and the
+        counts by class are included unless ``asserted_statements``,
+        ``literals`` or ``types`` is false; by default they are included
+        unless ``approximate``.
+
+        With ``approximate`` no statement table is read: the total number of
+        statements is the one of `approximate_len`. The counts by predicate
+        and by class take a full scan and the statistics of the database do
+        not have them, so asking for them as well raises a ValueError.
+        """
+        if approximate:
+            requested = [name for name, value in (
+                ("asserted_statements", asserted_statements), ("literals", literals), ("types", types)) if value]
+            if requested:
+                raise ValueError("Approximate statistics have no counts for {}".format(", ".join(requested)))
         statistics = {
-            "store": dict(total_num_statements=len(self)),
+            "store": dict(total_num_statements=self.approximate_len() if approximate else len(self)),
         }
+        if approximate:
+            return statistics
 
         with self.engine.connect() as connection:
             session = Session(bind=connection)
-            if asserted_statements:
+            if asserted_statements is None or asserted_statements:
                 table = self.tables["asserted_statements"]
                 group_by_column = table.c.predicate
-                statistics["asserted_statements"] = get_group_by_count(session, group_by_column)
-            if literals:
+                statistics["asserted_statements"] = self._decode_counts(
+                    connection, get_group_by_count(session, group_by_column))
+            if literals is None or literals:
                 table = self.tables["literal_statements"]
                 group_by_column = table.c.predicate
-                statistics["literals"] = get_group_by_count(session, group_by_column)
-            if types:
+                statistics["literals"] = self._decode_counts(
+                    connection, get_group_by_count(session, group_by_column))
+            if types is None or types:
                 table = self.tables["type_statements"]
                 group_by_column = table.c.klass
-                statistics["types"] = get_group_by_count(session, group_by_column)
+                statistics["types"] = self._decode_counts(
+                    connection, get_group_by_count(session, group_by_column))
 
         return statistics
+
+    def approximate_len(self):
+        """
+        Estimate the number of statements in the store from the statistics of the database.
+
+        Unlike `len`, this does not read the statement tables, and takes about
+        the same time however large the store is. The estimate is the number
+        of rows of the asserted partitions, so a triple asserted in several
+        contexts is counted once per context. A store that maintains its
+        counts returns those instead.
+
+        Returns:
+            int: the estimated number of statements, or None if the database
+                has no statistics on the statement tables yet (e.g. before the
+                first ANALYZE). A table without statistics while the others
+                have some, as an empty table may, counts as empty.
+        """
+        if self.maintain_counts:
+            return len(self)
+
+        with self.engine.connect() as connection:
+            counts = get_catalog_row_counts(connection, [self.tables[name].name for name in ASSERTED_TABLES])
+        if not counts:
+            return None
+        return int(sum(counts.values()))
+
+    def _decode_counts(self, connection, counts):
+        """Key the counts by term text in a dictionary-encoded store."""
+        return dict(self._decode_term_ids(connection, list(counts.items()), (0,)))
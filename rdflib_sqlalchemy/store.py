@@ -1,6 +1,9 @@
 """SQLAlchemy-based RDF store."""
 import hashlib
+import itertools
 import logging
+import time
+from contextlib import contextmanager, nullcontext
 
 import sqlalchemy
 from rdflib import (
@@ -11,11 +14,11 @@ from rdflib import (
 from rdflib.term import Variable
 from rdflib.graph import Graph, QuotedGraph
 from rdflib.namespace import RDF
-from rdflib.plugins.stores.regexmatching import PYTHON_REGEX, REGEXTerm
-from rdflib.store import CORRUPTED_STORE, VALID_STORE, NodePickler, Store
+from rdflib.plugins.stores.regexmatching import NATIVE_REGEX, REGEXTerm
+from rdflib.store import CORRUPTED_STORE, VALID_STORE, NodePickler, Store, TripleAddedEvent
 from six import text_type
 from sqlalchemy import MetaData, inspect
-from sqlalchemy.sql import expression, select, delete
+from sqlalchemy.sql import delete, expression, functions, select
 from sqlalchemy.exc import OperationalError
 
 from rdflib_sqlalchemy.constants import (
@@ -26,20 +29,32 @@ from rdflib_sqlalchemy.constants import (
     COUNT_SELECT,
     INTERNED_PREFIX,
     QUOTED_PARTITION,
+    REVERSE_TERM_COMBINATIONS,
+    TRIPLE_SELECT,
     TRIPLE_SELECT_NO_ORDER,
 )
 from rdflib_sqlalchemy.tables import (
     create_asserted_statements_table,
+    create_choices_table,
+    create_contexts_table,
     create_literal_statements_table,
     create_namespace_binds_table,
     create_quoted_statements_table,
+    create_statement_counts_table,
+    create_terms_table,
     create_type_statements_table,
-    get_table_names,
+    get_index_profile,
+    hash_column,
 )
-from rdflib_sqlalchemy.base import SQLGeneratorMixin
-from rdflib_sqlalchemy.sql import union_select
+from rdflib_sqlalchemy.base import TERM_COLUMNS, SQLGeneratorMixin, TermChoices, literal_language, term_parameter
+from rdflib_sqlalchemy.bulk import BulkLoadMixin
+from rdflib_sqlalchemy.counts import CountsMixin
+from rdflib_sqlalchemy.events import TriplesAddedEvent
+from rdflib_sqlalchemy.sparql import register_custom_eval
+from rdflib_sqlalchemy.sql import partitions_overlap, register_sqlite_regexp, term_select, union_select
 from rdflib_sqlalchemy.statistics import StatisticsMixin
-from rdflib_sqlalchemy.termutils import extract_triple
+from rdflib_sqlalchemy.termutils import TermCache, create_term, extract_triples
+from rdflib_sqlalchemy.types import TermIdType, TermType, term_hash, term_text
 
 
 _logger = logging.getLogger(__name__)
@@ -73,7 +88,7 @@ def generate_interned_id(identifier):
     )
 
 
-class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
+class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin, CountsMixin, BulkLoadMixin):
     """
     SQL-92 formula-aware implementation of an rdflib Store.
 
@@ -93,11 +108,15 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
     context_aware = True
     formula_aware = True
     transaction_aware = True
-    regex_matching = PYTHON_REGEX
+    regex_matching = NATIVE_REGEX
     configuration = Literal("sqlite://")
 
     def __init__(self, identifier=None, configuration=None, engine=None,
-                 max_terms_per_where=800):
+                 max_terms_per_where=800, stream_results=False, fetch_size=1000,
+                 sparql_pushdown=False, term_dictionary=False, hash_keys=False,
+                 index_profile="default", lean_schema=False, term_cache_size=10000,
+                 maintain_counts=False, graph_aware=False, contexts_page_size=1000,
+                 choices_table_threshold=800, chunk_size=10000, commit_per_chunk=False):
         """
         Initialisation.
 
@@ -109,13 +128,90 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
                 for more details.
             engine (`sqlalchemy.engine.Engine`, optional): a pre-existing engine instance.
             max_terms_per_where (int): The max number of terms (s/p/o) in a call to
-                triples_choices to combine in one SQL "where" clause. Important for SQLite
-                back-end with SQLITE_MAX_EXPR_DEPTH limit and SQLITE_LIMIT_COMPOUND_SELECT
-                -- must find a balance that doesn't hit either of those.
+                triples_choices to combine in one SQL "IN" list, when they are not put in a
+                temporary table. Important for SQLite back-end with SQLITE_MAX_VARIABLE_NUMBER
+                and SQLITE_LIMIT_COMPOUND_SELECT -- must find a balance that doesn't hit either
+                of those.
+            stream_results (bool): If True, `triples` reads its results through a
+                server-side cursor and yields each triple as soon as all of its contexts
+                have been read, instead of loading the whole result set into memory first.
+            fetch_size (int): The number of rows fetched from the server-side cursor at a
+                time when `stream_results` is enabled.
+            sparql_pushdown (bool): If True, SPARQL basic graph patterns evaluated against
+                this store are compiled into a single SQL query joining the triple patterns,
+                instead of being evaluated by rdflib with one `triples` call per pattern and
+                binding.
+            term_dictionary (bool): If True, the store is dictionary-encoded: the text of
+                each distinct term is stored once in a terms table, and the statement tables
+                hold integer term ids instead of repeating the text in every row. Must match
+                the layout the tables were created with.
+            hash_keys (bool): If True, every term column gets a 64-bit hash key column, and the
+                indexes are built on the hash keys instead of on a prefix of the term text. The
+                unique keys end with the first 64 characters of the terms, so that terms with
+                colliding hashes are kept apart. Lookups probe the hash key and then compare the text. In a
+                dictionary-encoded store this applies to the terms table. Must match the layout
+                the tables were created with.
+            index_profile: The statement indexes created with the tables. Either the name of
+                one of `rdflib_sqlalchemy.tables.INDEX_PROFILES` -- "default" (one index per
+                term position) or "read_optimized" (composite POS, OSP and CSPO indexes, so that
+                every triple pattern is answered from an index prefix) -- or a sequence of index
+                orderings such as ``("pos", "osp")``. The unique SPOC key is always created.
+            lean_schema (bool): If True, the statement tables are created write-optimized: without
+                the surrogate id column and the termComb index, with the unique key of the
+                asserted and rdf:type partitions as their (clustered) primary key, and without
+                the profile indexes that are a prefix of the unique key. With `hash_keys` the
+                unique key stays a unique index. On MySQL the primary key requires
+                `term_dictionary`, as it cannot be built on text columns. Must match the layout
+                the tables were created with.
+            term_cache_size (int): The maximum number of entries in each of the term caches
+                (of decoded URIRefs, BNodes, Literals and other terms, of the Graphs of the
+                contexts of results, and of term ids in a dictionary-encoded store). The least
+                recently used entries are evicted first.
+                None means unbounded and 0 disables the caches.
+            maintain_counts (bool): If True, the number of statements of each context and
+                partition is kept in a counts table, updated in the same transaction as the
+                statements, and `len` reads it instead of counting the statements. The length
+                of the whole store is then the sum over the contexts, counting a triple once
+                for every context it is asserted in. Use `verify_counts` with ``repair=True``
+                to build the counts of a store created without them.
+            graph_aware (bool): If True, the contexts of the store are kept in a registry
+                table, so that `contexts` reads the registry instead of scanning the statement
+                tables, and graphs can be added (and remain) empty with `add_graph` until they
+                are removed with `remove_graph`, as for an rdflib `~rdflib.graph.Dataset`. The
+                registry of an existing store is filled from its statements when it is created.
+            contexts_page_size (int): The number of contexts `contexts` reads with each query.
+                None reads them all with a single query.
+            choices_table_threshold (int): The number of choices of a term above which
+                `triples_choices` inserts them in a temporary table and joins it, so that a
+                single query serves any number of choices. None always uses "IN" lists of
+                `max_terms_per_where` terms. MySQL cannot refer to a temporary table more than
+                once in a query, and always uses the lists.
+            chunk_size (int): The number of quads `addN` and `bulk_load` read from their input
+                and write to the database at a time, which bounds the memory they use.
+            commit_per_chunk (bool): If True, `addN` commits each chunk of quads in its own
+                transaction, so that a failure only rolls back the chunk it happens in. Otherwise
+                the quads of a call are added in a single transaction.
         """
         self.identifier = identifier and identifier or "hardcoded"
         self.engine = engine
+        if engine is not None:
+            register_sqlite_regexp(engine)
         self.max_terms_per_where = max_terms_per_where
+        self.stream_results = stream_results
+        self.fetch_size = fetch_size
+        self.sparql_pushdown = sparql_pushdown
+        self.term_dictionary = term_dictionary
+        self.hash_keys = hash_keys
+        self.index_profile = get_index_profile(index_profile)
+        self.lean_schema = lean_schema
+        self.maintain_counts = maintain_counts
+        self.graph_aware = graph_aware
+        self.contexts_page_size = contexts_page_size
+        self.choices_table_threshold = choices_table_threshold
+        self.chunk_size = chunk_size
+        self.commit_per_chunk = commit_per_chunk
+        if sparql_pushdown:
+            register_custom_eval()
 
         # Use only the first 10 bytes of the digest
         self._interned_id = generate_interned_id(self.identifier)
@@ -133,11 +229,17 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
 
         self.cacheHits = 0
         self.cacheMisses = 0
-        self.literalCache = {}
-        self.uriCache = {}
-        self.bnodeCache = {}
-        self.otherCache = {}
+        self.literalCache = TermCache(term_cache_size)
+        self.uriCache = TermCache(term_cache_size)
+        self.bnodeCache = TermCache(term_cache_size)
+        self.otherCache = TermCache(term_cache_size)
+        self._term_ids = TermCache(term_cache_size)
+        self._term_texts = TermCache(term_cache_size)
+        self._context_graphs = TermCache(term_cache_size)
         self._node_pickler = None
+        self._choices_tables = itertools.count()
+        self._triples_queries = {}
+        self._insert_statements = {}
 
         self._create_table_definitions()
 
@@ -179,7 +281,20 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
             return "<Partitioned unopened SQL N3 Store>"
 
     def __len__(self, context=None):
-        """Number of statements in the store."""
+        """
+        Number of statements in the store.
+
+        Without a context this is the number of statements of the asserted
+        partitions in all contexts, so a triple asserted in several contexts
+        is counted once per context, whether the store maintains its counts
+        or counts the statement tables.
+        """
+        if self.maintain_counts and not isinstance(context, REGEXTerm):
+            return self._counted_len(context)
+        return self._exact_len(context)
+
+    def _exact_len(self, context=None):
+        """Number of statements in the store, counted from the distinct rows of the statement tables."""
         quoted_table = self.tables["quoted_statements"]
         asserted_table = self.tables["asserted_statements"]
         asserted_type_table = self.tables["type_statements"]
@@ -223,7 +338,7 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
 
     @property
     def table_names(self):
-        return get_table_names(interned_id=self._interned_id)
+        return [table.name for table in self.tables.values()]
 
     @property
     def node_pickler(self):
@@ -274,6 +389,7 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
             kwargs = configuration
 
         self.engine = sqlalchemy.create_engine(url, **kwargs)
+        register_sqlite_regexp(self.engine)
         try:
             conn = self.engine.connect()
         except OperationalError:
@@ -292,7 +408,16 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
 
     def create_all(self):
         """Create all of the database tables (idempotent)."""
+        fill_contexts = self.graph_aware and not inspect(self.engine).has_table(self.tables["contexts"].name)
         self.metadata.create_all(self.engine)
+        if fill_contexts:
+            with self.engine.begin() as connection:
+                self._register_contexts(connection, self._scan_contexts())
+        if self.term_dictionary:
+            # rdf:type is implied by the rows of the type partition, so it must
+            # always have an id
+            with self._begin_adding() as (connection, term_ids):
+                self._get_term_ids(connection, [text_type(RDF.type)], term_ids)
 
     def close(self, commit_pending_transaction=False):
         """
@@ -315,6 +440,9 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
             except Exception:
                 _logger.exception("unable to drop table.")
                 raise
+        self._term_ids.clear()
+        self._term_texts.clear()
+        self._context_graphs.clear()
 
     # Triple Methods
 
@@ -327,10 +455,17 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
             context, quoted,
         )
 
-        statement = self._add_ignore_on_conflict(statement)
-        with self.engine.begin() as connection:
+        statement = self._insert_statement(statement.table)
+        with self._begin_adding() as (connection, term_ids):
             try:
-                connection.execute(statement, params)
+                self._encode_term_params(connection, [params], term_ids)
+                result = connection.execute(statement, params)
+                if self.graph_aware:
+                    self._register_contexts(connection, [context.identifier])
+                if self.maintain_counts:
+                    self._update_counts(connection, {
+                        (term_text(context.identifier), self._partition(statement.table)): result.rowcount,
+                    })
             except Exception:
                 _logger.exception(
                     "Add failed with statement: %s, params: %s",
@@ -338,30 +473,121 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
                 )
                 raise
 
-    def addN(self, quads):
-        """Add a list of triples in quads form."""
-        commands_dict = {}
-        add_event = super(SQLAlchemy, self).add
-        for subject, predicate, obj, context in quads:
-            add_event((subject, predicate, obj), context)
-            command_type, statement, params = self._get_build_command(
-                (subject, predicate, obj),
-                context,
-                isinstance(context, QuotedGraph),
-            )
+    def addN(self, quads, progress=None):
+        """
+        Add a list of triples in quads form.
 
-            command_dict = commands_dict.setdefault(command_type, {})
-            command_dict.setdefault("statement", statement)
-            command_dict.setdefault("params", []).append(params)
+        The quads are consumed in chunks of `chunk_size`, and each chunk is
+        written before the next one is read. The events of the quads are only
+        built for subscribed handlers (see `TriplesAddedEvent`).
 
+        Args:
+            quads: iterable of ``(subject, predicate, object, context)`` quads
+            progress (callable, optional): Called after each chunk with the number
+                of quads added so far and the number of seconds since the call started
+        """
+        start = time.time()
+        added = 0
+        with nullcontext((None, None)) if self.commit_per_chunk else self._begin_adding() as transaction:
+            for chunk in grouper(quads, self.chunk_size):
+                with self._begin_adding() if self.commit_per_chunk else nullcontext(transaction) as (
+                        connection, term_ids):
+                    self._add_quads(connection, chunk, term_ids)
+                added += len(chunk)
+                if progress is not None:
+                    progress(added, time.time() - start)
+
+    @contextmanager
+    def _begin_adding(self):
+        """
+        Begin a transaction adding statements.
+
+        Yields its connection and the dict in which `_get_term_ids` collects
+        the ids of the terms the transaction looks up or adds to the term
+        dictionary. They are only cached once the transaction commits, as a
+        rollback would leave the ids of the terms it added dangling.
+        """
+        term_ids = {}
         with self.engine.begin() as connection:
-            try:
-                for command in commands_dict.values():
-                    statement = self._add_ignore_on_conflict(command['statement'])
-                    connection.execute(statement, command["params"])
-            except Exception:
-                _logger.exception("AddN failed.")
-                raise
+            yield connection, term_ids
+        self._term_ids.update(term_ids)
+
+    def _add_quads(self, connection, quads, term_ids):
+        """Add a chunk of quads with one insert per statement table."""
+        self._dispatch_added(quads)
+        contexts = set()
+        commands = self._build_statement_rows(quads, contexts, self.maintain_counts)
+
+        try:
+            if connection.dialect.name == "sqlite" and not (
+                    self.term_dictionary or self.hash_keys or self.maintain_counts):
+                # The rows hold the values as they are stored
+                for (table, _), (columns, rows) in commands.items():
+                    connection.exec_driver_sql(self._insert_sql(connection, table, columns), rows)
+            else:
+                self._insert_params(connection, commands, term_ids)
+            if self.graph_aware:
+                self._register_contexts(connection, contexts)
+        except Exception:
+            _logger.exception("AddN failed.")
+            raise
+
+    def _dispatch_added(self, quads, per_quad=True):
+        """
+        Dispatch the events of the addition of a chunk of quads.
+
+        A `TripleAddedEvent` is dispatched for each quad (if ``per_quad``) and a
+        `TriplesAddedEvent` for the chunk, each only if a handler is subscribed to it.
+        """
+        handlers = self.dispatcher.get_map()
+        if not handlers:
+            return
+        if per_quad and TripleAddedEvent in handlers:
+            add_event = super(SQLAlchemy, self).add
+            for subject, predicate, obj, context in quads:
+                add_event((subject, predicate, obj), context)
+        if TriplesAddedEvent in handlers:
+            self.dispatcher.dispatch(TriplesAddedEvent(quads=quads))
+
+    def _insert_params(self, connection, commands, term_ids):
+        """Insert the rows built by `_build_statement_rows` as encoded parameter dicts."""
+        params_lists = dict(
+            (key, [dict(zip(columns, row)) for row in rows])
+            for key, (columns, rows) in commands.items()
+        )
+        self._encode_term_params(connection, [
+            params
+            for params_list in params_lists.values()
+            for params in params_list
+        ], term_ids)
+        deltas = {}
+        for (table, context), params_list in params_lists.items():
+            statement = self._insert_statement(table)
+            if self.maintain_counts:
+                key = (term_text(context), self._partition(table))
+                deltas[key] = self._insert_counted_statements(connection, statement, params_list, context)
+            else:
+                connection.execute(statement, params_list)
+        if deltas:
+            self._update_counts(connection, deltas)
+
+    def _insert_sql(self, connection, table, columns):
+        """Return the SQL of `_insert_statement` for positional parameters in the order of ``columns``."""
+        key = (connection.dialect.name, table.name, columns)
+        sql = self._insert_statements.get(key)
+        if sql is None:
+            compiled = self._insert_statement(table).compile(dialect=connection.dialect, column_keys=list(columns))
+            assert compiled.positiontup == list(columns)
+            sql = self._insert_statements[key] = compiled.string
+        return sql
+
+    def _insert_statement(self, table):
+        """Return the insert of statements in ``table`` ignoring the existing ones, built once per table."""
+        key = (self.engine.name, table.name)
+        statement = self._insert_statements.get(key)
+        if statement is None:
+            statement = self._insert_statements[key] = self._add_ignore_on_conflict(table.insert())
+        return statement
 
     def _add_ignore_on_conflict(self, statement):
         if self.engine.name == 'sqlite':
@@ -396,7 +622,7 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
                     if not self.STRONGLY_TYPED_TERMS or isinstance(obj, Literal):
                         # remove literal triple
                         clause = self.build_clause(literal_table, subject, predicate, obj, context)
-                        connection.execute(literal_table.delete().where(clause))
+                        self._delete_statements(connection, literal_table, clause, context)
 
                     for table in [quoted_table, asserted_table]:
                         # If asserted non rdf:type table and obj is Literal,
@@ -405,20 +631,32 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
                             continue
                         else:
                             clause = self.build_clause(table, subject, predicate, obj, context)
-                            connection.execute(table.delete().where(clause))
+                            self._delete_statements(connection, table, clause, context)
 
                 if predicate == RDF.type or predicate is None:
                     # Need to check rdf:type and quoted partitions (in addition
                     # perhaps)
                     clause = self.build_clause(asserted_type_table, subject, RDF.type, obj, context, True)
-                    connection.execute(asserted_type_table.delete().where(clause))
+                    self._delete_statements(connection, asserted_type_table, clause, context)
 
                     clause = self.build_clause(quoted_table, subject, predicate, obj, context)
-                    connection.execute(quoted_table.delete().where(clause))
+                    self._delete_statements(connection, quoted_table, clause, context)
             except Exception:
                 _logger.exception("Removal failed.")
                 raise
 
+    def _delete_statements(self, connection, table, clause, context=None):
+        if self.maintain_counts:
+            partition = self._partition(table)
+            deleted = self._delete_counted_statements(connection, table, clause, context)
+            self._update_counts(connection, dict(
+                ((context, partition), -count) for context, count in deleted.items()))
+            return
+        statement = table.delete()
+        if clause is not None:
+            statement = statement.where(clause)
+        connection.execute(statement)
+
     def _triples_helper(self, triple, context=None):
         subject, predicate, obj = triple
 
@@ -490,72 +728,366 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
 
         return selects
 
-    def _do_triples_select(self, selects, context):
-        q = union_select(selects, distinct=True, select_type=TRIPLE_SELECT_NO_ORDER)
-        with self.engine.connect() as connection:
-            res = connection.execute(q)
-            # TODO: False but it may have limitations on text column. Check
-            # NOTE: SQLite does not support ORDER BY terms that aren't
-            # integers, so the entire result set must be iterated in order
-            # to be able to return a generator of contexts
-            result = res.fetchall()
+    def _do_triples_select(self, selects, context, connection=None):
+        return self._read_triples(self._triples_query(selects), context, connection)
+
+    def _triples_query(self, selects):
+        """
+        Build the union of the triple selects, ordered if the results are streamed.
+
+        Duplicate rows are only eliminated where partitions can overlap (see
+        `partitions_overlap`), sparing the database a sort of the whole result.
+        """
+        return union_select(selects, distinct=partitions_overlap(selects),
+                            select_type=TRIPLE_SELECT if self.stream_results else TRIPLE_SELECT_NO_ORDER,
+                            type_predicate=self._type_predicate())
+
+    def _read_triples(self, q, context, connection=None, params=None):
+        """Execute a triples query built by `_triples_query` with ``params``, and yield its triples."""
+        if self.stream_results:
+            for m in self._read_streaming_triples(q, context, connection, params):
+                yield m
+            return
+
         tripleCoverage = {}
 
-        for rt in result:
-            id, s, p, o, (graphKlass, idKlass, graphId) = extract_triple(rt, self, context)
-            contexts = tripleCoverage.get((s, p, o), [])
-            contexts.append(graphKlass(self, idKlass(graphId)))
-            tripleCoverage[(s, p, o)] = contexts
+        for rows in self._select_row_blocks(q, connection=connection, params=params):
+            for id, s, p, o, (graphKlass, idKlass, graphId) in extract_triples(rows, self, context):
+                contexts = tripleCoverage.get((s, p, o), [])
+                contexts.append(self._context_graph(graphKlass, idKlass, graphId))
+                tripleCoverage[(s, p, o)] = contexts
 
         for (s, p, o), contexts in tripleCoverage.items():
             yield (s, p, o), (c for c in contexts)
 
+    def _read_streaming_triples(self, q, context, connection=None, params=None):
+        """
+        Yield the matching triples while reading from a server-side cursor.
+
+        The rows are ordered on (subject, predicate, object), so all of the
+        contexts of a triple are adjacent in the result and can be merged as
+        they arrive. Memory use is bounded by `fetch_size` regardless of the
+        size of the result.
+        """
+        current = None
+        contexts = []
+        for rows in self._select_row_blocks(q, connection=connection, params=params):
+            for id, s, p, o, (graphKlass, idKlass, graphId) in extract_triples(rows, self, context):
+                if (s, p, o) != current:
+                    if current is not None:
+                        yield current, (c for c in contexts)
+                    current = (s, p, o)
+                    contexts = []
+                contexts.append(self._context_graph(graphKlass, idKlass, graphId))
+        if current is not None:
+            yield current, (c for c in contexts)
+
+    def _context_graph(self, graphKlass, idKlass, graphId):
+        """Return the Graph of a context of the results, shared by all the results in that context."""
+        key = (graphKlass, idKlass, graphId)
+        graph = self._context_graphs.get(key)
+        if graph is None:
+            graph = self._context_graphs[key] = graphKlass(self, idKlass(graphId))
+        return graph
+
+    def _select_rows(self, q, term_positions=(1, 2, 3, 4)):
+        """Execute a select and yield its rows, see `_select_row_blocks`."""
+        for rows in self._select_row_blocks(q, term_positions):
+            for rt in rows:
+                yield rt
+
+    def _select_row_blocks(self, q, term_positions=(1, 2, 3, 4), connection=None, params=None):
+        """
+        Execute a select and yield its rows in blocks.
+
+        With `stream_results`, the rows are read through a server-side cursor
+        in blocks of `fetch_size`. Otherwise the result is fetched at once, as
+        a single block, and the connection is released before it is yielded.
+        In a dictionary-encoded store the term ids at ``term_positions`` are
+        replaced by the text of the terms. The select runs on ``connection``
+        if one is given, with the bind parameter values ``params``.
+        """
+        if self.stream_results:
+            with self._connect(connection) as connection:
+                res = connection.execution_options(
+                    stream_results=True, yield_per=self.fetch_size).execute(q, params)
+                for rows in res.partitions():
+                    yield self._decode_term_ids(connection, rows, term_positions)
+        else:
+            with self._connect(connection) as connection:
+                res = connection.execute(q, params)
+                # TODO: False but it may have limitations on text column. Check
+                # NOTE: SQLite does not support ORDER BY terms that aren't
+                # integers, so the entire result set must be iterated in order
+                # to be able to return a generator of contexts
+                rows = self._decode_term_ids(connection, res.fetchall(), term_positions)
+            yield rows
+
+    def _connect(self, connection=None):
+        """Return a context manager for ``connection``, or for a new connection if it is None."""
+        if connection is not None:
+            return nullcontext(connection)
+        return self.engine.connect()
+
     def triples(self, triple, context=None):
-        """ A generator over all the triples matching a pattern. """
-        selects = self._triples_helper(triple, context)
-        for m in self._do_triples_select(selects, context):
+        """
+        A generator over all the triples matching a pattern.
+
+        The query is cached by the shape of the pattern, see `_pattern_query`.
+        """
+        q, params = self._pattern_query("triples", self._triples_query, triple, context)
+        for m in self._read_triples(q, context, params=params):
             yield m
 
+    def exists(self, triple, context=None):
+        """
+        Return whether a statement matches a pattern.
+
+        Unlike iterating over `triples`, the partitions are queried in turn
+        for a single matching row, and the first match ends the search.
+        """
+        queries, params = self._pattern_query("exists", self._exists_queries, triple, context)
+        with self.engine.connect() as connection:
+            return any(connection.execute(q, params).first() is not None for q in queries)
+
+    def first(self, triple, context=None):
+        """
+        Return the first triple matching a pattern, or None if none does.
+
+        The partitions are queried in turn for a single matching row, as by
+        `exists`. Use it for lookups expecting a single value, where
+        `rdflib.graph.Graph.value` would read every match through `triples`.
+        """
+        queries, params = self._pattern_query("first", self._first_queries, triple, context)
+        with self.engine.connect() as connection:
+            for q in queries:
+                rows = connection.execute(q, params).fetchall()
+                if rows:
+                    rows = self._decode_term_ids(connection, rows, (1, 2, 3, 4))
+                    _, s, p, o, _ = extract_triples(rows, self, context)[0]
+                    return s, p, o
+        return None
+
+    def distinct_terms(self, triple, position, context=None):
+        """
+        Generate the distinct terms at one position of the triples matching a pattern.
+
+        Only the column of that position is selected, with DISTINCT, and
+        decoded, e.g. ``distinct_terms((None, RDF.type, klass), "subject")``
+        generates the members of a class without reading their triples.
+
+        Args:
+            triple: The pattern, as for `triples`
+            position (str): "subject", "predicate" or "object"
+            context: The context to match in, as for `triples`
+        """
+        index = ("subject", "predicate", "object").index(position)
+        q, params = self._pattern_query(
+            ("distinct", position),
+            lambda selects: term_select(selects, position, self._type_predicate()),
+            triple, context)
+        with self.engine.connect() as connection:
+            rows = self._decode_term_ids(connection, connection.execute(q, params).fetchall(), (0,))
+        seen = set()
+        for term, termComb, objLanguage, objDatatype in rows:
+            term = create_term(term, REVERSE_TERM_COMBINATIONS[termComb][index], self, objLanguage, objDatatype)
+            # A term is selected once for each of the term combinations it appears in
+            if term not in seen:
+                seen.add(term)
+                yield term
+
+    def _exists_queries(self, selects):
+        queries = []
+        for table, clause, _ in selects:
+            q = select(expression.literal(1)).select_from(table)
+            if clause is not None:
+                q = q.where(clause)
+            queries.append(q.limit(1))
+        return queries
+
+    def _first_queries(self, selects):
+        return [self._triples_query([component]).limit(1) for component in selects]
+
+    def _pattern_query(self, kind, build, triple, context):
+        """
+        Return the query ``build`` makes of the selects of a pattern, and the
+        values of its bind parameters.
+
+        The query is built once for each ``kind`` of query and shape of
+        pattern (see `_pattern_shape`), with bind parameters in place of the
+        terms, and reused with the terms of every pattern of that shape.
+        """
+        shape = self._pattern_shape(triple, context)
+        if shape is None:
+            return build(self._triples_helper(triple, context)), None
+
+        q = self._triples_queries.get((kind, shape))
+        if q is None:
+            q = build(self._triples_helper(*self._pattern_parameters(triple, context)))
+            self._triples_queries[(kind, shape)] = q
+        return q, self._pattern_values(triple, context)
+
+    def _pattern_shape(self, triple, context):
+        """
+        Return the shape of a triple pattern, or None if its query cannot be cached.
+
+        Patterns of the same shape have the same query but for the values of
+        the terms: the shape is made of the kind of each term (and whether a
+        Literal has a language and a datatype), whether the predicate is
+        rdf:type, whether there is a context, and the settings the query
+        depends on.
+        """
+        shape = [self.STRONGLY_TYPED_TERMS, self.stream_results, triple[1] == RDF.type]
+        for term in triple:
+            if term is None or type(term) in (URIRef, BNode):
+                shape.append(type(term))
+            elif type(term) is Literal:
+                shape.append((Literal, term.language is not None, term.datatype is not None))
+            else:
+                return None
+        if context is None:
+            shape.append(None)
+        elif isinstance(context, REGEXTerm) or type(context.identifier) not in (URIRef, BNode):
+            return None
+        else:
+            shape.append(True)
+        return tuple(shape)
+
+    def _pattern_parameters(self, triple, context):
+        """Return a pattern of the shape of ``(triple, context)`` made of `TermParameter` placeholders."""
+        pattern = [
+            None if term is None or (name == "predicate" and term == RDF.type) else term_parameter(term, name)
+            for name, term in zip(("subject", "predicate", "object"), triple)
+        ]
+        if triple[1] == RDF.type:
+            pattern[1] = RDF.type
+        if context is not None:
+            context = Graph(self, identifier=term_parameter(context.identifier, "context"))
+        return tuple(pattern), context
+
+    def _pattern_values(self, triple, context):
+        """Return the values of the bind parameters of the query of ``(triple, context)``."""
+        values = {}
+        terms = zip(("subject", "predicate", "object", "context"),
+                    tuple(triple) + (context.identifier if context is not None else None,))
+        for name, term in terms:
+            if term is None or (name == "predicate" and term == RDF.type):
+                continue
+            values[name] = text_type(term)
+            if self.hash_keys:
+                values[hash_column(name)] = term_hash(values[name])
+            # Only the language and datatype of the object are compared
+            if name == "object" and isinstance(term, Literal):
+                if term.language is not None:
+                    values["object_language"] = literal_language(term)
+                if term.datatype is not None:
+                    values["object_datatype"] = text_type(term.datatype)
+        return values
+
     def triples_choices(self, triple, context=None):
         """
         A variant of triples.
+
+        One of the terms of ``triple`` may be a list, matching any of its terms.
         """
-        # We already support accepting a list for s/p/o
         subject, predicate, object_ = triple
-        selects = []
         if isinstance(object_, list):
             assert not isinstance(
                 subject, list), "object_ / subject are both lists"
             assert not isinstance(
                 predicate, list), "object_ / predicate are both lists"
-            if not object_:
-                object_ = None
-            for o in grouper(object_, self.max_terms_per_where):
-                for sels in self._triples_helper((subject, predicate, o), context):
-                    selects.append(sels)
-
+            position = 2
         elif isinstance(subject, list):
             assert not isinstance(
                 predicate, list), "subject / predicate are both lists"
-            if not subject:
-                subject = None
-            for s in grouper(subject, self.max_terms_per_where):
-                for sels in self._triples_helper((s, predicate, object_), context):
-                    selects.append(sels)
-
+            position = 0
         elif isinstance(predicate, list):
             assert not isinstance(
                 subject, list), "predicate / subject are both lists"
-            if not predicate:
-                predicate = None
-            for p in grouper(predicate, self.max_terms_per_where):
-                for sels in self._triples_helper((subject, p, object_), context):
-                    selects.append(sels)
-
-        for m in self._do_triples_select(selects, context):
-            yield m
+            position = 1
+        else:
+            position = None
+
+        pattern = list(triple)
+        choices = pattern[position] if position is not None else None
+        if not choices:
+            if position is not None:
+                pattern[position] = None
+            for m in self._do_triples_select(self._triples_helper(tuple(pattern), context), context):
+                yield m
+        elif self._use_choices_table(choices):
+            for m in self._triples_choices_table(pattern, position, context):
+                yield m
+        else:
+            selects = []
+            for group in grouper(choices, self.max_terms_per_where):
+                pattern[position] = group
+                selects.extend(self._triples_helper(tuple(pattern), context))
+            for m in self._do_triples_select(selects, context):
+                yield m
+
+    def _use_choices_table(self, choices):
+        return (self.choices_table_threshold is not None
+                and len(choices) > self.choices_table_threshold
+                and self.engine.name != "mysql"
+                and not any(isinstance(term, REGEXTerm) for term in choices))
+
+    def _triples_choices_table(self, pattern, position, context):
+        """
+        Match the choices of ``pattern`` at ``position`` by inserting them in
+        a temporary table, and run the query on the connection that holds it.
+        """
+        name = "{}_choices_{}".format(self._interned_id, next(self._choices_tables))
+        choices = create_choices_table(
+            name, MetaData(), TermIdType if self.term_dictionary else TermType,
+            self.hash_keys and not self.term_dictionary)
+        texts = set(term_text(term) for term in pattern[position] if term)
+        with self.engine.begin() as connection:
+            choices.create(connection)
+            try:
+                if self.term_dictionary:
+                    rows = [{"term": term_id} for term_id in self._lookup_term_ids(connection, texts).values()]
+                else:
+                    rows = [{"term": text} for text in texts]
+                    if self.hash_keys:
+                        for row in rows:
+                            row[hash_column("term")] = term_hash(row["term"])
+                if rows:
+                    connection.execute(choices.insert(), rows)
+                pattern[position] = TermChoices(choices)
+                selects = self._triples_helper(tuple(pattern), context)
+                for m in self._do_triples_select(selects, context, connection):
+                    yield m
+            finally:
+                choices.drop(connection)
 
     def contexts(self, triple=None):
+        """
+        Generate the contexts of the store, or the contexts containing ``triple``.
+
+        The contexts are read in pages of `contexts_page_size` ordered by context,
+        each page starting after the last context of the previous one, so that
+        neither the database nor the store holds all of them at once.
+        """
+        if triple is None and self.graph_aware:
+            contexts = self._page_contexts([(self.tables["contexts"], None, None)], term_ids=False)
+        else:
+            contexts = self._page_contexts(self._context_selects(triple))
+        for context in contexts:
+            yield URIRef(context)
+
+    def count_contexts(self, triple=None):
+        """Return the number of contexts of the store, or of the contexts containing ``triple``."""
+        if triple is None and self.graph_aware:
+            q = select(functions.count()).select_from(self.tables["contexts"])
+        else:
+            q = union_select(self._context_selects(triple), distinct=True, select_type=CONTEXT_SELECT)
+            q = select(functions.count()).select_from(q.subquery())
+        with self.engine.connect() as connection:
+            return connection.execute(q).scalar()
+
+    def _context_selects(self, triple):
+        """Return the `union_select` components selecting the contexts containing ``triple``."""
         quoted_table = self.tables["quoted_statements"]
         asserted_table = self.tables["asserted_statements"]
         asserted_type_table = self.tables["type_statements"]
@@ -617,20 +1149,74 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
 
             clause = self.build_clause(quoted, subject, predicate, obj)
             selects.append((quoted, clause, QUOTED_PARTITION))
-            q = union_select(selects, distinct=True, select_type=CONTEXT_SELECT)
+            return selects
         else:
-            selects = [
+            return [
                 (typetable, None, ASSERTED_TYPE_PARTITION),
                 (quoted, None, QUOTED_PARTITION),
                 (asserted, None, ASSERTED_NON_TYPE_PARTITION),
                 (literal, None, ASSERTED_LITERAL_PARTITION), ]
-            q = union_select(selects, distinct=True, select_type=CONTEXT_SELECT)
 
-        with self.engine.connect() as connection:
-            res = connection.execute(q)
-            rt = res.fetchall()
-        for context in [rtTuple[0] for rtTuple in rt]:
-            yield URIRef(context)
+    def _page_contexts(self, selects, term_ids=True):
+        """
+        Generate the contexts selected by the `union_select` components ``selects``,
+        a page at a time.
+
+        Args:
+            selects (list of tuples): The components, as for `union_select`
+            term_ids (bool): Whether the selected contexts are term ids in a
+                dictionary-encoded store (as opposed to the context registry,
+                which holds text)
+        """
+        after = None
+        while True:
+            q = union_select(selects, distinct=True, select_type=CONTEXT_SELECT,
+                             limit=self.contexts_page_size, after=after)
+            with self.engine.connect() as connection:
+                rows = connection.execute(q).fetchall()
+                if rows:
+                    after = rows[-1][0]
+                if term_ids:
+                    rows = self._decode_term_ids(connection, rows, (0,))
+            for rtTuple in rows:
+                yield rtTuple[0]
+            if self.contexts_page_size is None or len(rows) < self.contexts_page_size:
+                return
+
+    def _scan_contexts(self):
+        """Return the text of every context of the statement tables."""
+        return list(self._page_contexts(self._context_selects(None)))
+
+    def add_graph(self, graph):
+        """Add a graph to the context registry of a graph-aware store."""
+        if not self.graph_aware:
+            return super(SQLAlchemy, self).add_graph(graph)
+        with self.engine.begin() as connection:
+            self._register_contexts(connection, [graph.identifier])
+
+    def remove_graph(self, graph):
+        """Remove a graph and its statements from a graph-aware store."""
+        if not self.graph_aware:
+            return super(SQLAlchemy, self).remove_graph(graph)
+        contexts = self.tables["contexts"]
+        with self.engine.begin() as connection:
+            try:
+                self._delete_context(connection, graph)
+                connection.execute(contexts.delete().where(
+                    self.build_term_clause(contexts.c.context, term_text(graph.identifier), False)))
+            except Exception:
+                _logger.exception("Graph removal failed.")
+                raise
+
+    def _register_contexts(self, connection, identifiers):
+        """Add context identifiers to the context registry, ignoring the ones already in it."""
+        rows = [{"context": term_text(identifier)} for identifier in set(identifiers)]
+        if not rows:
+            return
+        if self.hash_keys:
+            for row in rows:
+                row[hash_column("context")] = term_hash(row["context"])
+        connection.execute(self._add_ignore_on_conflict(self.tables["contexts"].insert()), rows)
 
     # Namespace persistence interface implementation
 
@@ -687,13 +1273,148 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
 
     def _create_table_definitions(self):
         self.metadata = MetaData()
+        term_type = TermIdType if self.term_dictionary else TermType
+        # In a dictionary-encoded store the statement tables already hold fixed-width keys
+        hash_keys = self.hash_keys and not self.term_dictionary
+        table_args = (self._interned_id, self.metadata, term_type, hash_keys, self.index_profile, self.lean_schema)
         self.tables = {
-            "asserted_statements": create_asserted_statements_table(self._interned_id, self.metadata),
-            "type_statements": create_type_statements_table(self._interned_id, self.metadata),
-            "literal_statements": create_literal_statements_table(self._interned_id, self.metadata),
-            "quoted_statements": create_quoted_statements_table(self._interned_id, self.metadata),
+            "asserted_statements": create_asserted_statements_table(*table_args),
+            "type_statements": create_type_statements_table(*table_args),
+            "literal_statements": create_literal_statements_table(*table_args),
+            "quoted_statements": create_quoted_statements_table(*table_args),
             "namespace_binds": create_namespace_binds_table(self._interned_id, self.metadata),
         }
+        if self.term_dictionary:
+            self.tables["terms"] = create_terms_table(self._interned_id, self.metadata, self.hash_keys)
+        if self.maintain_counts:
+            self.tables["statement_counts"] = create_statement_counts_table(
+                self._interned_id, self.metadata, self.hash_keys)
+        if self.graph_aware:
+            self.tables["contexts"] = create_contexts_table(self._interned_id, self.metadata, self.hash_keys)
+
+    def _type_predicate(self):
+        """Return the expression `union_select` selects as the predicate of rdf:type rows."""
+        if self.term_dictionary:
+            return self.build_term_id_select(RDF.type)
+        return None
+
+    def _encode_term_params(self, connection, params_list, term_ids):
+        """
+        Encode the terms of insert parameters for the layout of the store, in place.
+
+        The hash keys of the terms are added when the store uses hash keys, and
+        in a dictionary-encoded store the terms are replaced by their ids (see
+        `_get_term_ids` for ``term_ids``).
+        """
+        if not self.term_dictionary:
+            if self.hash_keys:
+                for params in params_list:
+                    for column in TERM_COLUMNS:
+                        if column in params:
+                            params[hash_column(column)] = term_hash(params[column])
+            return
+
+        ids = self._get_term_ids(connection, set(
+            term_text(params[column])
+            for params in params_list
+            for column in TERM_COLUMNS
+            if column in params
+        ), term_ids)
+        for params in params_list:
+            for column in TERM_COLUMNS:
+                if column in params:
+                    params[column] = ids[term_text(params[column])]
+
+    def _get_term_ids(self, connection, texts, term_ids):
+        """
+        Return a dict mapping each of the term texts to its id, adding the
+        texts missing from the term dictionary.
+
+        The ids that are not cached are looked up in ``term_ids``, the ids the
+        transaction of ``connection`` already got, and then in the database,
+        and added to ``term_ids``. They are not cached here, so that a rolled
+        back transaction cannot leave the ids of terms that do not exist in the
+        cache: `_begin_adding` caches them once the transaction commits.
+        """
+        ids = {}
+        missing = []
+        for text in texts:
+            term_id = self._term_ids.get(text, term_ids.get(text))
+            if term_id is None:
+                missing.append(text)
+            else:
+                ids[text] = term_id
+
+        if missing:
+            found = self._lookup_term_ids(connection, missing)
+            ids.update(found)
+            new = [text for text in missing if text not in found]
+            if new:
+                terms = self.tables["terms"]
+                rows = [{"term": text} for text in new]
+                if self.hash_keys:
+                    for row in rows:
+                        row[hash_column("term")] = term_hash(row["term"])
+                connection.execute(self._add_ignore_on_conflict(terms.insert()), rows)
+                ids.update(self._lookup_term_ids(connection, new))
+            term_ids.update((text, ids[text]) for text in missing if text in ids)
+        return ids
+
+    def _lookup_term_ids(self, connection, texts):
+        terms = self.tables["terms"]
+        ids = {}
+        for chunk in grouper(texts, self.max_terms_per_where):
+            if self.hash_keys:
+                # Probe the hash keys; the text check below weeds out collisions
+                clause = terms.c[hash_column("term")].in_([term_hash(text) for text in chunk])
+            else:
+                clause = terms.c.term.in_(chunk)
+            wanted = set(chunk)
+            for term_id, text in connection.execute(select(terms.c.id, terms.c.term).where(clause)):
+                if text in wanted:
+                    ids[text] = term_id
+        return ids
+
+    def _decode_term_ids(self, connection, rows, positions):
+        """
+        Replace the term ids at ``positions`` of each row by the term texts.
+
+        The texts missing from the cache are read from the term dictionary
+        with one query per `max_terms_per_where` ids.
+        """
+        if not self.term_dictionary:
+            return rows
+
+        texts = {}
+        missing = set()
+        for rt in rows:
+            for position in positions:
+                term_id = rt[position]
+                if term_id is None or term_id in texts:
+                    continue
+                text = self._term_texts.get(term_id)
+                if text is None:
+                    missing.add(term_id)
+                else:
+                    texts[term_id] = text
+
+        if missing:
+            terms = self.tables["terms"]
+            for chunk in grouper(missing, self.max_terms_per_where):
+                res = connection.execute(
+                    select(terms.c.id, terms.c.term).where(terms.c.id.in_(chunk)))
+                for term_id, text in res:
+                    texts[term_id] = text
+                    self._term_texts[term_id] = text
+
+        decoded = []
+        for rt in rows:
+            rt = list(rt)
+            for position in positions:
+                if rt[position] is not None:
+                    rt[position] = texts[rt[position]]
+            decoded.append(tuple(rt))
+        return decoded
 
     def _get_build_command(self, triple, context=None, quoted=False):
         """
@@ -742,23 +1463,31 @@ class SQLAlchemy(Store, SQLGeneratorMixin, StatisticsMixin):
         return command_type, statement, params
 
     def _remove_context(self, context):
-        """Remove context."""
-        assert context is not None
-        quoted_table = self.tables["quoted_statements"]
-        asserted_table = self.tables["asserted_statements"]
-        asserted_type_table = self.tables["type_statements"]
-        literal_table = self.tables["literal_statements"]
+        """
+        Remove context.
 
+        A graph-aware store keeps the (now empty) context in its registry
+        until it is removed with `remove_graph`.
+        """
+        assert context is not None
         with self.engine.begin() as connection:
             try:
-                for table in [quoted_table, asserted_table,
-                              asserted_type_table, literal_table]:
-                    clause = self.build_context_clause(context, table)
-                    connection.execute(table.delete().where(clause))
+                self._delete_context(connection, context)
             except Exception:
                 _logger.exception("Context removal failed.")
                 raise
 
+    def _delete_context(self, connection, context):
+        quoted_table = self.tables["quoted_statements"]
+        asserted_table = self.tables["asserted_statements"]
+        asserted_type_table = self.tables["type_statements"]
+        literal_table = self.tables["literal_statements"]
+
+        for table in [quoted_table, asserted_table,
+                      asserted_type_table, literal_table]:
+            clause = self.build_context_clause(context, table)
+            self._delete_statements(connection, table, clause, context)
+
     def _verify_store_exists(self):
         """
         Verify store (e.g. all tables) exist.
@@ -1,10 +1,39 @@
-from sqlalchemy import Column, Table, Index, types
+from sqlalchemy import Column, Table, Index, PrimaryKeyConstraint, types
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import expression, functions
+from sqlalchemy.sql.visitors import InternalTraversal
 
-from rdflib_sqlalchemy.types import TermType
+from rdflib_sqlalchemy.types import TermHashType, TermIdType, TermType
 
 
 MYSQL_MAX_INDEX_LENGTH = 200
 
+LITERAL_KEY_LENGTH = 128
+''' Prefix length of the terms in the unique keys of the literal and quoted statements on MySQL,
+which leaves room for the 255 characters of the language or datatype within the 3072 bytes of a key '''
+
+HASH_COLUMN_TEMPLATE = "{}_hash"
+
+HASH_KEY_TEXT_LENGTH = 64
+''' Length of the prefix of the term text that follows the hash keys in a unique key '''
+
+TERM_INDEX_COLUMNS = ("subject", "predicate", "object", "context", "member", "klass", "term")
+
+STATEMENT_INDEX_COLUMNS = {"s": "subject", "p": "predicate", "o": "object", "c": "context"}
+TYPE_INDEX_COLUMNS = {"s": "member", "o": "klass", "c": "context"}
+
+INDEX_PROFILES = {
+    # One index per term position, next to the unique SPOC key
+    "default": ("s", "p", "o", "c"),
+    # Composite indexes serving every triple pattern with a bound term from an
+    # index prefix: SPOC (the unique key) for s, sp and spo, POS for p and po,
+    # OSP for o and os, and CSPO for context scans
+    "read_optimized": ("pos", "osp", "cspo"),
+}
+''' Named sets of statement indexes, see `get_index_profile` '''
+
+DEFAULT_INDEX_PROFILE = INDEX_PROFILES["default"]
+
 TABLE_NAME_TEMPLATES = [
     "{interned_id}_asserted_statements",
     "{interned_id}_literal_statements",
@@ -14,6 +43,182 @@ TABLE_NAME_TEMPLATES = [
 ]
 
 
+class TermPrefix(expression.ColumnElement):
+    """
+    The first characters of a term column, as a part of an index.
+
+    It is an expression index part, ``substr(column, 1, length)``, except on
+    MySQL, where it is the prefix key part ``column(length)``.
+    """
+
+    inherit_cache = True
+    _traverse_internals = [
+        ("column", InternalTraversal.dp_clauseelement),
+        ("length", InternalTraversal.dp_plain_obj),
+    ]
+
+    def __init__(self, column, length):
+        self.column = expression.literal_column(column)
+        self.length = length
+        self.type = TermType()
+
+
+@compiles(TermPrefix)
+def _compile_term_prefix(element, compiler, **kw):
+    return "substr({}, 1, {:d})".format(compiler.process(element.column, **kw), element.length)
+
+
+@compiles(TermPrefix, "mysql")
+def _compile_mysql_term_prefix(element, compiler, **kw):
+    return "{}({:d})".format(compiler.process(element.column, **kw), element.length)
+
+
+def _index_length(term_type, length=MYSQL_MAX_INDEX_LENGTH):
+    """MySQL only accepts a prefix length for indexes over text columns."""
+    return length if term_type is TermType else None
+
+
+def _literal_kind():
+    """
+    The key part telling apart literals with the same lexical form: their
+    language, or else their datatype, or else ``''``.
+
+    The language and datatype columns are NULL for plain literals, and as
+    NULL never equals NULL in a unique key, they cannot be keyed on as they
+    are. A literal never has both, and a language tag has no colon.
+    """
+    return functions.coalesce(
+        expression.literal_column("objlanguage"), expression.literal_column("objdatatype"), "")
+
+
+def _key_columns(columns):
+    return [_literal_kind() if c == "objLanguage" else c for c in columns]
+
+
+def hash_column(column):
+    """Return the name of the hash key column of a term column."""
+    return HASH_COLUMN_TEMPLATE.format(column)
+
+
+def _term_columns(names, term_type, hash_keys, nullable=()):
+    """Create the term columns of a table, each followed by its hash key column if requested."""
+    columns = []
+    for name in names:
+        columns.append(Column(name, term_type, nullable=name in nullable))
+        if hash_keys:
+            columns.append(Column(hash_column(name), TermHashType, nullable=name in nullable))
+    return columns
+
+
+def _term_index(name, columns, term_type, hash_keys, unique=False, length=MYSQL_MAX_INDEX_LENGTH):
+    """
+    Create an index over term columns.
+
+    With hash keys the index is built on the hash key columns, which have a
+    fixed width, instead of on a prefix of the text. Columns that are not
+    terms (the language of a literal) are indexed as they are. A unique index
+    ends with the first `HASH_KEY_TEXT_LENGTH` characters of the terms, so
+    that its entries stay small while terms with colliding hashes are still
+    told apart, unless they also share that prefix.
+    """
+    texts = [c for c in columns if c in TERM_INDEX_COLUMNS]
+    if unique:
+        columns = _key_columns(columns)
+    if hash_keys:
+        key = [hash_column(c) if c in TERM_INDEX_COLUMNS else c for c in columns]
+        if not unique:
+            return Index(name, *key)
+        return Index(name, *(key + [TermPrefix(c, HASH_KEY_TEXT_LENGTH) for c in texts]), unique=True)
+    length = _index_length(term_type, length)
+    return Index(name, *columns, unique=unique, mysql_length=length and dict((c, length) for c in texts))
+
+
+def _id_columns(lean):
+    """The surrogate id column of the statement tables, left out of a lean schema."""
+    if lean:
+        return []
+    return [Column("id", types.Integer, nullable=False, primary_key=True)]
+
+
+def _term_comb_indexes(name, lean):
+    """The ``termComb`` index, left out of a lean schema (``termComb`` is only ever filtered on)."""
+    if lean:
+        return []
+    return [Index(name, "termComb")]
+
+
+def _statement_key(name, columns, term_type, hash_keys, primary=False, length=MYSQL_MAX_INDEX_LENGTH):
+    """
+    Create the unique key of a statement table.
+
+    As the primary key, it is the clustered index on MySQL. SQLite tables
+    keep their rowid: in a WITHOUT ROWID table every other index would hold
+    a copy of the whole key. MySQL does not accept a primary key on text
+    columns, so there a primary key needs a dictionary-encoded store. With
+    hash keys the key stays a unique index, as a primary key cannot hold the
+    prefixes of the terms that follow the hash keys.
+    """
+    if primary and not hash_keys:
+        return PrimaryKeyConstraint(*columns, name=name)
+    return _term_index(name, columns, term_type, hash_keys, unique=True, length=length)
+
+
+def get_index_profile(profile):
+    """
+    Resolve an index profile.
+
+    Args:
+        profile: The name of one of `INDEX_PROFILES`, or a sequence of index orderings, each
+            a string of the letters ``s``, ``p``, ``o`` and ``c`` (e.g. ``("pos", "osp")``).
+
+    Returns:
+        tuple: the index orderings of the profile
+    """
+    if isinstance(profile, str):
+        try:
+            return INDEX_PROFILES[profile]
+        except KeyError:
+            raise ValueError("Unknown index profile {!r}, expected one of {}".format(
+                profile, ", ".join(sorted(INDEX_PROFILES))))
+    orderings = tuple(profile)
+    for ordering in orderings:
+        if not ordering or set(ordering) - set(STATEMENT_INDEX_COLUMNS) or len(set(ordering)) != len(ordering):
+            raise ValueError("Invalid index ordering {!r}".format(ordering))
+    return orderings
+
+
+def _profile_indexes(prefix, profile, letter_columns, unique_key, term_type, hash_keys,
+                     single_names=None, skip=(), lean=False):
+    """
+    Create the indexes of an index profile for one statement table.
+
+    The letters of each ordering are mapped to the columns of the table
+    (letters the table has no column for are dropped, e.g. the predicate of
+    the rdf:type partition). Orderings that end up empty, repeat an earlier
+    one, or match the unique key are skipped. In a lean schema, orderings
+    that are a prefix of the unique key are skipped too, since the key
+    serves the same lookups.
+    """
+    single_names = single_names or {}
+    indexes = []
+    seen = set(skip)
+    seen.add(tuple(unique_key))
+    for ordering in profile:
+        columns = tuple(letter_columns[letter] for letter in ordering if letter in letter_columns)
+        if not columns or columns in seen or (lean and columns == tuple(unique_key[:len(columns)])):
+            continue
+        seen.add(columns)
+        if len(columns) == 1:
+            name = single_names.get(columns[0], "{}_{}_index".format(prefix, ordering))
+        else:
+            name = "{}_{}_index".format(
+                prefix, "".join(letter for letter in ordering if letter in letter_columns))
+        # Keep the total key length of composite indexes within the MySQL limit
+        length = MYSQL_MAX_INDEX_LENGTH if len(columns) < 4 else 191
+        indexes.append(_term_index(name, columns, term_type, hash_keys, length=length))
+    return indexes
+
+
 def get_table_names(interned_id):
     return [
         table_name_template.format(interned_id=interned_id)
@@ -21,181 +226,95 @@ def get_table_names(interned_id):
     ]
 
 
-def create_asserted_statements_table(interned_id, metadata):
+def create_asserted_statements_table(interned_id, metadata, term_type=TermType, hash_keys=False,
+                                     index_profile=DEFAULT_INDEX_PROFILE, lean=False):
+    key = ("subject", "predicate", "object", "context")
     return Table(
         "{interned_id}_asserted_statements".format(interned_id=interned_id),
         metadata,
-        Column("id", types.Integer, nullable=False, primary_key=True),
-        Column("subject", TermType, nullable=False),
-        Column("predicate", TermType, nullable=False),
-        Column("object", TermType, nullable=False),
-        Column("context", TermType, nullable=False),
+        *_id_columns(lean),
+        *_term_columns(("subject", "predicate", "object", "context"), term_type, hash_keys),
         Column("termcomb", types.Integer, nullable=False, key="termComb"),
-        Index(
-            "{interned_id}_A_s_index".format(interned_id=interned_id),
-            "subject",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_A_p_index".format(interned_id=interned_id),
-            "predicate",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_A_o_index".format(interned_id=interned_id),
-            "object",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_A_c_index".format(interned_id=interned_id),
-            "context",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_A_termComb_index".format(interned_id=interned_id),
-            "termComb",
-        ),
-        Index(
+        *_term_comb_indexes("{interned_id}_A_termComb_index".format(interned_id=interned_id), lean),
+        _statement_key(
             "{interned_id}_asserted_spoc_key".format(interned_id=interned_id),
-            "subject",
-            "predicate",
-            "object",
-            "context",
-            unique=True,
-            mysql_length=191,
+            key, term_type, hash_keys, primary=lean, length=191,
         ),
+        *_profile_indexes(
+            "{interned_id}_A".format(interned_id=interned_id), index_profile, STATEMENT_INDEX_COLUMNS,
+            key, term_type, hash_keys, lean=lean)
     )
 
 
-def create_type_statements_table(interned_id, metadata):
+def create_type_statements_table(interned_id, metadata, term_type=TermType, hash_keys=False,
+                                 index_profile=DEFAULT_INDEX_PROFILE, lean=False):
+    key = ("member", "klass", "context")
     return Table(
         "{interned_id}_type_statements".format(interned_id=interned_id),
         metadata,
-        Column("id", types.Integer, nullable=False, primary_key=True),
-        Column("member", TermType, nullable=False),
-        Column("klass", TermType, nullable=False),
-        Column("context", TermType, nullable=False),
+        *_id_columns(lean),
+        *_term_columns(("member", "klass", "context"), term_type, hash_keys),
         Column("termcomb", types.Integer, nullable=False, key="termComb"),
-        Index(
-            "{interned_id}_member_index".format(interned_id=interned_id),
-            "member",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_klass_index".format(interned_id=interned_id),
-            "klass",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_c_index".format(interned_id=interned_id),
-            "context",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_T_termComb_index".format(interned_id=interned_id),
-            "termComb",
-        ),
-        Index(
+        *_term_comb_indexes("{interned_id}_T_termComb_index".format(interned_id=interned_id), lean),
+        _statement_key(
             "{interned_id}_type_mkc_key".format(interned_id=interned_id),
-            "member",
-            "klass",
-            "context",
-            unique=True,
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
+            key, term_type, hash_keys, primary=lean,
         ),
+        *_profile_indexes(
+            "{interned_id}_T".format(interned_id=interned_id), index_profile, TYPE_INDEX_COLUMNS,
+            key, term_type, hash_keys, lean=lean,
+            single_names={
+                "member": "{interned_id}_member_index".format(interned_id=interned_id),
+                "klass": "{interned_id}_klass_index".format(interned_id=interned_id),
+                "context": "{interned_id}_c_index".format(interned_id=interned_id),
+            })
     )
 
 
-def create_literal_statements_table(interned_id, metadata):
+def create_literal_statements_table(interned_id, metadata, term_type=TermType, hash_keys=False,
+                                    index_profile=DEFAULT_INDEX_PROFILE, lean=False):
+    key = ("subject", "predicate", "object", "objLanguage", "context")
     return Table(
         "{interned_id}_literal_statements".format(interned_id=interned_id),
         metadata,
-        Column("id", types.Integer, nullable=False, primary_key=True),
-        Column("subject", TermType, nullable=False),
-        Column("predicate", TermType, nullable=False),
-        Column("object", TermType),
-        Column("context", TermType, nullable=False),
+        *_id_columns(lean),
+        *_term_columns(("subject", "predicate", "object", "context"), term_type, hash_keys, nullable=("object",)),
         Column("termcomb", types.Integer, nullable=False, key="termComb"),
         Column("objlanguage", types.String(255), key="objLanguage"),
         Column("objdatatype", types.String(255), key="objDatatype"),
-        Index(
-            "{interned_id}_L_s_index".format(interned_id=interned_id),
-            "subject",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_L_p_index".format(interned_id=interned_id),
-            "predicate",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_L_c_index".format(interned_id=interned_id),
-            "context",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_L_termComb_index".format(interned_id=interned_id),
-            "termComb",
-        ),
-        Index(
+        *_term_comb_indexes("{interned_id}_L_termComb_index".format(interned_id=interned_id), lean),
+        # The key holds an expression over the language and datatype, so it cannot be the primary key
+        _statement_key(
             "{interned_id}_literal_spoc_key".format(interned_id=interned_id),
-            "subject",
-            "predicate",
-            "object",
-            "objLanguage",
-            "context",
-            unique=True,
-            mysql_length=153,
+            key, term_type, hash_keys, length=LITERAL_KEY_LENGTH,
         ),
+        # Literal values are rarely looked up on their own, so there is no
+        # single-column index on the object of literal statements
+        *_profile_indexes(
+            "{interned_id}_L".format(interned_id=interned_id), index_profile, STATEMENT_INDEX_COLUMNS,
+            key, term_type, hash_keys, lean=lean, skip=(("object",),))
     )
 
 
-def create_quoted_statements_table(interned_id, metadata):
+def create_quoted_statements_table(interned_id, metadata, term_type=TermType, hash_keys=False,
+                                   index_profile=DEFAULT_INDEX_PROFILE, lean=False):
+    key = ("subject", "predicate", "object", "objLanguage", "context")
     return Table(
         "{interned_id}_quoted_statements".format(interned_id=interned_id),
         metadata,
-        Column("id", types.Integer, nullable=False, primary_key=True),
-        Column("subject", TermType, nullable=False),
-        Column("predicate", TermType, nullable=False),
-        Column("object", TermType),
-        Column("context", TermType, nullable=False),
+        *_id_columns(lean),
+        *_term_columns(("subject", "predicate", "object", "context"), term_type, hash_keys, nullable=("object",)),
         Column("termcomb", types.Integer, nullable=False, key="termComb"),
         Column("objlanguage", types.String(255), key="objLanguage"),
         Column("objdatatype", types.String(255), key="objDatatype"),
-        Index(
-            "{interned_id}_Q_s_index".format(interned_id=interned_id),
-            "subject",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_Q_p_index".format(interned_id=interned_id),
-            "predicate",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_Q_o_index".format(interned_id=interned_id),
-            "object",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_Q_c_index".format(interned_id=interned_id),
-            "context",
-            mysql_length=MYSQL_MAX_INDEX_LENGTH,
-        ),
-        Index(
-            "{interned_id}_Q_termComb_index".format(interned_id=interned_id),
-            "termComb",
-        ),
-        Index(
+        *_term_comb_indexes("{interned_id}_Q_termComb_index".format(interned_id=interned_id), lean),
+        _statement_key(
             "{interned_id}_quoted_spoc_key".format(interned_id=interned_id),
-            "subject",
-            "predicate",
-            "object",
-            "objLanguage",
-            "context",
-            unique=True,
-            mysql_length=153,
+            key, term_type, hash_keys, length=LITERAL_KEY_LENGTH,
         ),
+        *_profile_indexes(
+            "{interned_id}_Q".format(interned_id=interned_id), index_profile, STATEMENT_INDEX_COLUMNS,
+            key, term_type, hash_keys, lean=lean)
     )
 
 
@@ -211,3 +330,87 @@ def create_namespace_binds_table(interned_id, metadata):
             mysql_length=MYSQL_MAX_INDEX_LENGTH,
         )
     )
+
+
+def create_terms_table(interned_id, metadata, hash_keys=False):
+    """
+    Create the dictionary of a dictionary-encoded store.
+
+    Each distinct term text is stored once and the statement tables refer to
+    it by id. The kind of each term is still given by the ``termComb`` of the
+    statement, so a URIRef and a Literal with the same text share an id.
+    """
+    return Table(
+        "{interned_id}_terms".format(interned_id=interned_id),
+        metadata,
+        Column("id", TermIdType, nullable=False, primary_key=True),
+        *_term_columns(("term",), TermType, hash_keys),
+        _term_index(
+            "{interned_id}_term_key".format(interned_id=interned_id),
+            ("term",), TermType, hash_keys,
+            unique=True,
+        ),
+    )
+
+
+def create_statement_counts_table(interned_id, metadata, hash_keys=False):
+    """
+    Create the table of maintained statement counts.
+
+    It holds the number of statements of each context in each partition
+    (one of the ``*_PARTITION`` constants). The context is stored as text
+    whatever the layout of the statement tables.
+    """
+    return Table(
+        "{interned_id}_statement_counts".format(interned_id=interned_id),
+        metadata,
+        *_term_columns(("context",), TermType, hash_keys),
+        Column("partition", types.Integer, nullable=False),
+        Column("statements", types.BigInteger, nullable=False),
+        _term_index(
+            "{interned_id}_counts_key".format(interned_id=interned_id),
+            ("context", "partition"), TermType, hash_keys,
+            unique=True,
+        ),
+    )
+
+
+def create_contexts_table(interned_id, metadata, hash_keys=False):
+    """
+    Create the registry of the contexts of a graph-aware store.
+
+    It holds every context statements were added to, and the graphs added
+    with ``add_graph``, including empty ones. The context is stored as text
+    whatever the layout of the statement tables.
+    """
+    return Table(
+        "{interned_id}_contexts".format(interned_id=interned_id),
+        metadata,
+        *_term_columns(("context",), TermType, hash_keys),
+        _term_index(
+            "{interned_id}_context_key".format(interned_id=interned_id),
+            ("context",), TermType, hash_keys,
+            unique=True,
+        ),
+    )
+
+
+def create_choices_table(name, metadata, term_type=TermType, hash_keys=False):
+    """
+    Create a temporary table holding the choices of a term of a `triples_choices` pattern.
+
+    A temporary table only exists for the connection that creates it.
+    """
+    return Table(name, metadata, *_term_columns(("term",), term_type, hash_keys), prefixes=["TEMPORARY"])
+
+
+def create_staging_table(table, metadata):
+    """
+    Create a temporary table with the columns of a statement table, to bulk load its rows into.
+
+    It has no surrogate id, keys or indexes, so that filling it is as cheap as possible.
+    On PostgreSQL it is dropped when the transaction commits.
+    """
+    columns = [Column(column.name, column.type, key=column.key) for column in table.columns if column.key != "id"]
+    return Table("{}_staging".format(table.name), metadata, *columns, prefixes=["TEMPORARY"],
+                 postgresql_on_commit="DROP")
@@ -1,4 +1,6 @@
 """Convenience functions for working with Terms and Graphs."""
+from collections import OrderedDict
+
 from rdflib import BNode, Graph, Literal, URIRef, Variable
 from rdflib.graph import QuotedGraph
 
@@ -8,7 +10,7 @@ from rdflib_sqlalchemy.constants import (
     REVERSE_TERM_COMBINATIONS,
 )
 
-__all__ = ["extract_triple"]
+__all__ = ["extract_triple", "extract_triples", "TermCache", "term_combination"]
 
 
 SUBJECT = 0
@@ -23,6 +25,68 @@ GRAPH_TERM_DICT = {
 }
 
 
+TERM_TYPE_LETTERS = {
+    URIRef: "U",
+    BNode: "B",
+    Literal: "L",
+    Variable: "V",
+    QuotedGraph: "F",
+}
+''' Term type letters of the term classes, see `term_to_letter` '''
+
+_TERM_CLASSES = dict(TERM_INSTANTIATION_DICT, F=QuotedGraph)
+
+TYPED_TERM_COMBINATIONS = dict(
+    ((_TERM_CLASSES[termComb[0]], _TERM_CLASSES[termComb[1]], _TERM_CLASSES[termComb[2]], termComb[3]), value)
+    for termComb, value in TERM_COMBINATIONS.items()
+)
+''' Term combinations by the classes of the subject, predicate and object and the letter of the context '''
+
+
+class TermCache(object):
+    """
+    A mapping of bounded size that evicts its least recently used entries.
+
+    Args:
+        maxsize (int): The maximum number of entries. ``None`` means unbounded
+            and 0 disables the cache.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if self.maxsize == 0:
+            return
+        entries = self._entries
+        entries[key] = value
+        entries.move_to_end(key)
+        if self.maxsize is not None and len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
 def normalize_graph(graph):
     """
     Take an instance of a ``Graph`` and return the instance's identifier and  ``type``.
@@ -168,6 +232,26 @@ def statement_to_term_combination(subject, predicate, obj, context):
                               term_to_letter(obj), normalize_graph(context)[-1])]
 
 
+def term_combination(subject, predicate, obj, context):
+    """
+    Map a statement to a Term Combo, as `statement_to_term_combination` does.
+
+    The term combination is looked up from the classes of the terms, and
+    only computed from their letters for terms of other classes (e.g.
+    subclasses or graphs).
+    """
+    if isinstance(context, QuotedGraph):
+        context_letter = "F"
+    else:
+        identifier = context.identifier
+        context_letter = TERM_TYPE_LETTERS.get(type(identifier)) or term_to_letter(identifier)
+    termComb = TYPED_TERM_COMBINATIONS.get((type(subject), type(predicate), type(obj), context_letter))
+    if termComb is None:
+        termComb = TERM_COMBINATIONS["%s%s%s%s" % (
+            term_to_letter(subject), term_to_letter(predicate), term_to_letter(obj), context_letter)]
+    return termComb
+
+
 def escape_quotes(qstr):
     """
     Escape backslashes.
@@ -193,15 +277,11 @@ def extract_triple(tupleRt, store, hardCodedContext=None):
     to interpret how to instantiate each term.
 
     """
-    try:
-        id, subject, predicate, obj, rtContext, termComb, \
-            objLanguage, objDatatype = tupleRt
-        termCombString = REVERSE_TERM_COMBINATIONS[termComb]
-        subjTerm, predTerm, objTerm, ctxTerm = termCombString
-    except ValueError:
-        id, subject, subjTerm, predicate, predTerm, obj, objTerm, \
-            rtContext, ctxTerm, objLanguage, objDatatype = tupleRt
+    if len(tupleRt) == 8:
+        return ROW_DECODERS[tupleRt[5]](tupleRt, store, hardCodedContext)
 
+    id, subject, subjTerm, predicate, predTerm, obj, objTerm, \
+        rtContext, ctxTerm, objLanguage, objDatatype = tupleRt
     context = rtContext is not None \
         and rtContext \
         or hardCodedContext.identifier
@@ -214,71 +294,112 @@ def extract_triple(tupleRt, store, hardCodedContext=None):
     return id, s, p, o, (graphKlass, idKlass, context)
 
 
+def extract_triples(rows, store, hardCodedContext=None):
+    """
+    Extract the triples of a block of result rows in one pass.
+
+    Equivalent to calling `extract_triple` on each row, without the per-row
+    dispatch on the row layout.
+    """
+    decoders = ROW_DECODERS
+    return [decoders[rt[5]](rt, store, hardCodedContext) for rt in rows]
+
+
 def create_term(termString, termType, store, objLanguage=None, objDatatype=None):
     """
     Take a term value, term type, and store instance and creates a term object.
 
-    QuotedGraphs are instantiated differently
+    QuotedGraphs are instantiated differently. Terms are looked up in (and
+    added to) the term caches of the store first, and the lookups are counted
+    in ``store.cacheHits`` and ``store.cacheMisses``.
     """
-    if termType == "L":
-        cache = store.literalCache.get((termString, objLanguage, objDatatype))
-        if cache is not None:
-            # store.cacheHits += 1
-            return cache
-        else:
-            # store.cacheMisses += 1
-            # rt = Literal(termString, objLanguage, objDatatype)
-            # store.literalCache[((termString, objLanguage, objDatatype))] = rt
-            if objLanguage and not objDatatype:
-                rt = Literal(termString, objLanguage)
-                store.literalCache[((termString, objLanguage))] = rt
-            elif objDatatype and not objLanguage:
-                rt = Literal(termString, datatype=objDatatype)
-                store.literalCache[((termString, objDatatype))] = rt
-            elif not objLanguage and not objDatatype:
-                rt = Literal(termString)
-                store.literalCache[((termString))] = rt
-            else:
-                rt = Literal(termString, objDatatype)
-                store.literalCache[((termString, objDatatype))] = rt
-            return rt
-    elif termType == "F":
-        cache = store.otherCache.get((termType, termString))
-        if cache is not None:
-            # store.cacheHits += 1
-            return cache
-        else:
-            # store.cacheMisses += 1
-            rt = QuotedGraph(store, URIRef(termString))
-            store.otherCache[(termType, termString)] = rt
-            return rt
-    elif termType == "B":
-        cache = store.bnodeCache.get((termString))
-        if cache is not None:
-            # store.cacheHits += 1
-            return cache
-        else:
-            # store.cacheMisses += 1
-            rt = TERM_INSTANTIATION_DICT[termType](termString)
-            store.bnodeCache[(termString)] = rt
-            return rt
-    elif termType == "U":
-        cache = store.uriCache.get((termString))
-        if cache is not None:
-            # store.cacheHits += 1
-            return cache
-        else:
-            # store.cacheMisses += 1
-            rt = URIRef(termString)
-            store.uriCache[(termString)] = rt
-            return rt
-    else:
-        cache = store.otherCache.get((termType, termString))
-        if cache is not None:
-            # store.cacheHits += 1
-            return cache
-        else:
-            # store.cacheMisses += 1
-            rt = TERM_INSTANTIATION_DICT[termType](termString)
-            store.otherCache[(termType, termString)] = rt
+    return TERM_DECODERS[termType](termString, store, objLanguage, objDatatype)
+
+
+def _decode_uri(termString, store, objLanguage=None, objDatatype=None):
+    rt = store.uriCache.get(termString)
+    if rt is not None:
+        store.cacheHits += 1
+        return rt
+    store.cacheMisses += 1
+    rt = store.uriCache[termString] = URIRef(termString)
+    return rt
+
+
+def _decode_bnode(termString, store, objLanguage=None, objDatatype=None):
+    rt = store.bnodeCache.get(termString)
+    if rt is not None:
+        store.cacheHits += 1
+        return rt
+    store.cacheMisses += 1
+    rt = store.bnodeCache[termString] = BNode(termString)
+    return rt
+
+
+def _decode_literal(termString, store, objLanguage=None, objDatatype=None):
+    key = (termString, objLanguage, objDatatype)
+    rt = store.literalCache.get(key)
+    if rt is not None:
+        store.cacheHits += 1
+        return rt
+    store.cacheMisses += 1
+    rt = store.literalCache[key] = Literal(termString, objLanguage or None, objDatatype or None)
+    return rt
+
+
+def _other_decoder(termType, factory):
+    def decode(termString, store, objLanguage=None, objDatatype=None):
+        key = (termType, termString)
+        rt = store.otherCache.get(key)
+        if rt is not None:
+            store.cacheHits += 1
             return rt
+        store.cacheMisses += 1
+        rt = store.otherCache[key] = factory(termString, store)
+        return rt
+    return decode
+
+
+TERM_DECODERS = {
+    "U": _decode_uri,
+    "B": _decode_bnode,
+    "L": _decode_literal,
+    "F": _other_decoder("F", lambda termString, store: QuotedGraph(store, URIRef(termString))),
+    "V": _other_decoder("V", lambda termString, store: Variable(termString)),
+}
+''' Term decoding functions by term type letter, see `create_term` '''
+
+
+def _row_decoder(termCombString):
+    """
+    Build the decoder of the rows of one term combination.
+
+    The term type letters, term decoders and graph classes are resolved once
+    here instead of for every row.
+    """
+    subjTerm, predTerm, objTerm, ctxTerm = termCombString
+    decode_subject = TERM_DECODERS[subjTerm]
+    decode_predicate = TERM_DECODERS[predTerm]
+    decode_object = TERM_DECODERS[objTerm]
+    graphKlass, idKlass = construct_graph(ctxTerm)
+
+    def decode(tupleRt, store, hardCodedContext=None):
+        id, subject, predicate, obj, rtContext, termComb, objLanguage, objDatatype = tupleRt
+        context = rtContext is not None \
+            and rtContext \
+            or hardCodedContext.identifier
+        return (
+            id,
+            decode_subject(subject, store),
+            decode_predicate(predicate, store),
+            decode_object(obj, store, objLanguage, objDatatype),
+            (graphKlass, idKlass, context),
+        )
+    return decode
+
+
+ROW_DECODERS = [
+    _row_decoder(REVERSE_TERM_COMBINATIONS[termComb])
+    for termComb in range(len(REVERSE_TERM_COMBINATIONS))
+]
+''' Row decoding functions indexed by termComb, see `extract_triples` '''
@@ -1,9 +1,35 @@
+import hashlib
+
 from rdflib.graph import Graph, QuotedGraph
 from rdflib.term import Node
 from six import text_type
 from sqlalchemy import types
 
 
+def term_text(value):
+    """Return the text a term (or the identifier of a graph) is stored as."""
+    if isinstance(value, (QuotedGraph, Graph)):
+        return text_type(value.identifier)
+    elif isinstance(value, Node):
+        return text_type(value)
+    else:
+        return value
+
+
+def term_hash(value):
+    """
+    Return the 64-bit key of a term, as a signed integer.
+
+    The key is the 8-byte BLAKE2b digest (``digest_size=8``) of the term
+    text, so it fits the BIGINT columns of every supported database. Keys
+    can collide: the unique keys and lookups also compare the text.
+    """
+    if value is None:
+        return None
+    digest = hashlib.blake2b(term_text(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
 class TermType(types.TypeDecorator):
     """Term typology."""
 
@@ -12,9 +38,11 @@ class TermType(types.TypeDecorator):
 
     def process_bind_param(self, value, dialect):
         """Process bound parameters."""
-        if isinstance(value, (QuotedGraph, Graph)):
-            return text_type(value.identifier)
-        elif isinstance(value, Node):
-            return text_type(value)
-        else:
-            return value
+        return term_text(value)
+
+
+TermHashType = types.BigInteger()
+''' Type of the hash key columns of the terms '''
+
+TermIdType = types.BigInteger().with_variant(types.Integer(), "sqlite")
+''' Type of the term ids of a dictionary-encoded store (SQLite only auto-increments INTEGER keys) '''
@@ -0,0 +1,46 @@
+import unittest
+
+from rdflib import BNode, Graph, Literal, URIRef, plugin
+from rdflib.graph import QuotedGraph
+from rdflib.namespace import XSD
+from rdflib.store import Store
+
+from rdflib_sqlalchemy.constants import TERM_COMBINATIONS
+from rdflib_sqlalchemy.termutils import extract_triple, extract_triples
+
+
+class ExtractTriplesTestCase(unittest.TestCase):
+    """Test the decoding of result rows into terms."""
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)()
+        self.context = Graph(identifier=URIRef("http://example.org/default"))
+
+    def test_row_layouts(self):
+        rows = [
+            (1, "http://example.org/s", "http://example.org/p", "x", "http://example.org/c",
+             TERM_COMBINATIONS["UULU"], "en", None),
+            (2, "b1", "http://example.org/p", "1", "f1",
+             TERM_COMBINATIONS["BULF"], None, str(XSD.integer)),
+            (3, "http://example.org/s", "http://example.org/p", "b2", None,
+             TERM_COMBINATIONS["UUBU"], None, None),
+        ]
+        self.assertEqual(extract_triples(rows, self.store, self.context), [
+            (1, URIRef("http://example.org/s"), URIRef("http://example.org/p"), Literal("x", lang="en"),
+             (Graph, URIRef, "http://example.org/c")),
+            (2, BNode("b1"), URIRef("http://example.org/p"), Literal(1),
+             (QuotedGraph, URIRef, "f1")),
+            (3, URIRef("http://example.org/s"), URIRef("http://example.org/p"), BNode("b2"),
+             (Graph, URIRef, self.context.identifier)),
+        ])
+        self.assertEqual([extract_triple(rt, self.store, self.context) for rt in rows],
+                         extract_triples(rows, self.store, self.context))
+
+    def test_explicit_term_types(self):
+        rt = (None, "s", "U", "p", "U", "o", "L", "c", "U", None, None)
+        self.assertEqual(extract_triple(rt, self.store),
+                         (None, URIRef("s"), URIRef("p"), Literal("o"), (Graph, URIRef, "c")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,273 @@
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from rdflib import ConjunctiveGraph, Literal, Namespace, RDF, URIRef, XSD, plugin
+from rdflib.store import Store
+
+
+EX = Namespace("http://example.org/")
+
+QUERY = """
+PREFIX ex: <http://example.org/>
+SELECT ?person ?name ?friend WHERE {
+    ?person a ex:Person ;
+        ex:name ?name ;
+        ex:knows ?friend .
+    ?friend a ex:Person .
+}
+"""
+
+
+class SPARQLPushdownTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, sparql_pushdown=True)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+
+        ctx1 = self.graph.get_context(EX.ctx1)
+        ctx2 = self.graph.get_context(EX.ctx2)
+        for ctx in (ctx1, ctx2):
+            ctx.add((EX.alice, RDF.type, EX.Person))
+            ctx.add((EX.alice, EX.name, Literal("Alice", lang="en")))
+        ctx1.add((EX.alice, EX.knows, EX.bob))
+        ctx1.add((EX.alice, EX.knows, EX.carol))
+        ctx1.add((EX.bob, RDF.type, EX.Person))
+        ctx1.add((EX.bob, EX.name, Literal("Bob")))
+        ctx1.add((EX.bob, EX.knows, EX.alice))
+        ctx2.add((EX.carol, EX.name, Literal("Carol")))
+        # A literal with the same lexical form as an IRI must not join with it
+        ctx2.add((EX.dave, EX.knows, Literal(str(EX.alice))))
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def _python_results(self, query):
+        self.store.sparql_pushdown = False
+        try:
+            return sorted(tuple(row) for row in self.graph.query(query))
+        finally:
+            self.store.sparql_pushdown = True
+
+    def test_matches_python_evaluation(self):
+        expected = self._python_results(QUERY)
+        with patch.object(self.store, "triples") as triples:
+            actual = sorted(tuple(row) for row in self.graph.query(QUERY))
+            self.assertFalse(triples.called)
+        self.assertEqual(actual, expected)
+        self.assertEqual(len(actual), 2)
+
+    def test_shared_lexical_form(self):
+        query = """
+        PREFIX ex: <http://example.org/>
+        SELECT ?s ?o WHERE { ?s ex:knows ?o . ?o ex:name ?name }
+        """
+        self.assertEqual(
+            sorted(tuple(row) for row in self.graph.query(query)),
+            [(EX.alice, EX.bob), (EX.alice, EX.carol), (EX.bob, EX.alice)])
+
+    def test_named_graph(self):
+        query = """
+        PREFIX ex: <http://example.org/>
+        SELECT ?s ?name WHERE { GRAPH ex:ctx2 { ?s ex:name ?name } }
+        """
+        self.assertEqual(
+            sorted(tuple(row) for row in self.graph.query(query)),
+            [(EX.alice, Literal("Alice", lang="en")), (EX.carol, Literal("Carol"))])
+
+    def test_initial_bindings(self):
+        query = """
+        PREFIX ex: <http://example.org/>
+        SELECT ?friend WHERE { ?person ex:knows ?friend }
+        """
+        result = self.graph.query(query, initBindings={"person": EX.bob})
+        self.assertEqual([tuple(row) for row in result], [(EX.alice,)])
+
+
+class SPARQLFilterPushdownTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, sparql_pushdown=True)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+
+        ctx = self.graph.get_context(EX.ctx)
+        ctx.add((EX.alice, EX.age, Literal(42)))
+        ctx.add((EX.bob, EX.age, Literal(25)))
+        ctx.add((EX.carol, EX.age, Literal("35")))
+        ctx.add((EX.dave, EX.age, Literal(30.5)))
+        ctx.add((EX.alice, EX.label, Literal("Alice", lang="en")))
+        ctx.add((EX.alice, EX.label, Literal("Alicia", lang="es")))
+        ctx.add((EX.bob, EX.label, Literal("Bob")))
+        ctx.add((EX.bob, EX.label, URIRef("http://example.org/Bob")))
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def _query(self, query):
+        from rdflib_sqlalchemy import sparql
+        with patch.object(sparql, "_ebv", wraps=sparql._ebv) as ebv:
+            result = sorted(tuple(row) for row in self.graph.query(
+                "PREFIX ex: <http://example.org/> " + query))
+        return result, ebv.call_count
+
+    def test_numeric_comparison(self):
+        result, python_filters = self._query(
+            "SELECT ?s WHERE { ?s ex:age ?age FILTER(?age > 30) }")
+        self.assertEqual(result, [(EX.alice,), (EX.dave,)])
+        self.assertEqual(python_filters, 0)
+
+    def test_reversed_comparison(self):
+        result, _ = self._query(
+            "SELECT ?s WHERE { ?s ex:age ?age FILTER(30 >= ?age) }")
+        self.assertEqual(result, [(EX.bob,)])
+
+    def test_lang(self):
+        result, python_filters = self._query(
+            'SELECT ?l WHERE { ?s ex:label ?l FILTER(lang(?l) = "es") }')
+        self.assertEqual(result, [(Literal("Alicia", lang="es"),)])
+        self.assertEqual(python_filters, 0)
+
+    def test_lang_case(self):
+        ctx = self.graph.get_context(EX.ctx)
+        ctx.add((EX.alice, EX.label, Literal("Alicia", lang="ES")))
+        result, _ = self._query(
+            'SELECT ?l WHERE { ex:alice ex:label ?l FILTER(lang(?l) != "") }')
+        self.assertEqual(result, [(Literal("Alice", lang="en"),), (Literal("Alicia", lang="es"),)])
+        result, _ = self._query(
+            'SELECT ?l WHERE { ?s ex:label ?l FILTER(lang(?l) = "es") }')
+        self.assertEqual(result, [(Literal("Alicia", lang="es"),)])
+        self.assertEqual(len(self.graph), 8)
+        self.assertIn((EX.alice, EX.label, Literal("Alicia", lang="ES")), self.graph)
+
+    def test_lang_mysql(self):
+        with patch.object(self.store.engine.dialect, "name", "mysql"):
+            result, python_filters = self._query(
+                'SELECT ?l WHERE { ?s ex:label ?l FILTER(lang(?l) = "es") }')
+        self.assertEqual(result, [(Literal("Alicia", lang="es"),)])
+        # MySQL collations ignore case, so the SQL comparison is rechecked
+        self.assertEqual(python_filters, 1)
+
+    def test_strstarts(self):
+        result, _ = self._query(
+            'SELECT ?l WHERE { ?s ex:label ?l FILTER(STRSTARTS(?l, "B")) }')
+        self.assertEqual(result, [(Literal("Bob"),)])
+        result, python_filters = self._query(
+            'SELECT ?l WHERE { ?s ex:label ?l FILTER(STRSTARTS(STR(?l), "http")) }')
+        self.assertEqual(result, [(URIRef("http://example.org/Bob"),)])
+        self.assertEqual(python_filters, 0)
+
+    def test_strstarts_case_sensitive(self):
+        ctx = self.graph.get_context(EX.ctx)
+        ctx.add((EX.carol, EX.label, Literal("bob")))
+        ctx.add((EX.carol, EX.label, Literal("B%x")))
+        result, _ = self._query(
+            'SELECT ?l WHERE { ?s ex:label ?l FILTER(STRSTARTS(?l, "B")) }')
+        self.assertEqual(result, [(Literal("B%x"),), (Literal("Bob"),)])
+        result, _ = self._query(
+            'SELECT ?l WHERE { ?s ex:label ?l FILTER(STRSTARTS(?l, "B%")) }')
+        self.assertEqual(result, [(Literal("B%x"),)])
+
+    def test_ill_typed_literal(self):
+        ctx = self.graph.get_context(EX.ctx)
+        ctx.add((EX.erin, EX.age, Literal("abc", datatype=XSD.integer)))
+        ctx.add((EX.frank, EX.age, Literal("1e3", datatype=XSD.integer)))
+        ctx.add((EX.gina, EX.age, Literal("INF", datatype=XSD.double)))
+        result, _ = self._query(
+            "SELECT ?s WHERE { ?s ex:age ?age FILTER(?age > 30) }")
+        self.assertEqual(result, [(EX.alice,), (EX.dave,), (EX.gina,)])
+        result, _ = self._query(
+            "SELECT ?s WHERE { ?s ex:age ?age FILTER(?age < 1) }")
+        self.assertEqual(result, [])
+
+    def test_large_integer(self):
+        ctx = self.graph.get_context(EX.ctx)
+        ctx.add((EX.erin, EX.age, Literal(2 ** 53)))
+        ctx.add((EX.frank, EX.age, Literal(2 ** 53 + 1)))
+        result, _ = self._query(
+            "SELECT ?s WHERE { ?s ex:age ?age FILTER(?age > 9007199254740992) }")
+        self.assertEqual(result, [(EX.frank,)])
+        result, _ = self._query(
+            "SELECT ?s WHERE { ?s ex:age ?age FILTER(?age = 9007199254740993) }")
+        self.assertEqual(result, [(EX.frank,)])
+        result, python_filters = self._query(
+            "SELECT ?s WHERE { ?s ex:age ?age FILTER(?age > 30) }")
+        self.assertEqual(result, [(EX.alice,), (EX.dave,), (EX.erin,), (EX.frank,)])
+        # Only the two large integers are rechecked in Python
+        self.assertEqual(python_filters, 2)
+
+    def test_regex(self):
+        result, python_filters = self._query(
+            'SELECT ?l WHERE { ?s ex:label ?l FILTER(regex(?l, "^Ali")) }')
+        self.assertEqual(result, [(Literal("Alice", lang="en"),), (Literal("Alicia", lang="es"),)])
+        self.assertEqual(python_filters, 0)
+
+    def test_untranslated_comparison(self):
+        result, python_filters = self._query(
+            'SELECT ?l WHERE { ?s ex:label ?l FILTER(?l = "Bob") }')
+        self.assertEqual(result, [(Literal("Bob"),)])
+        self.assertEqual(python_filters, 4)
+
+    def test_untranslated_conjunct(self):
+        result, python_filters = self._query(
+            'SELECT ?s WHERE { ?s ex:age ?age FILTER(?age > 20 && CONTAINS(STR(?s), "b")) }')
+        self.assertEqual(result, [(EX.bob,)])
+        # Only the rows left after the SQL part of the filter reach Python
+        self.assertEqual(python_filters, 3)
+
+
+class TermDictionarySPARQLTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, sparql_pushdown=True, term_dictionary=True)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+
+        ctx = self.graph.get_context(EX.ctx1)
+        ctx.add((EX.alice, RDF.type, EX.Person))
+        ctx.add((EX.alice, EX.name, Literal("Alice", lang="en")))
+        ctx.add((EX.alice, EX.knows, EX.bob))
+        ctx.add((EX.bob, RDF.type, EX.Person))
+        ctx.add((EX.bob, EX.name, Literal("Bob")))
+        ctx.add((EX.bob, EX.age, Literal(42)))
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def test_bgp(self):
+        self.assertEqual(
+            [tuple(row) for row in self.graph.query(QUERY)],
+            [(EX.alice, Literal("Alice", lang="en"), EX.bob)])
+
+    def test_initial_bindings(self):
+        result = self.graph.query(
+            "PREFIX ex: <http://example.org/> SELECT ?friend WHERE { ?person ex:knows ?friend }",
+            initBindings={"person": EX.alice})
+        self.assertEqual([tuple(row) for row in result], [(EX.bob,)])
+
+    def test_filter(self):
+        query = """
+        PREFIX ex: <http://example.org/>
+        SELECT ?s WHERE { ?s ex:age ?age ; ex:name ?name FILTER(?age > 30 && STRSTARTS(?name, "B")) }
+        """
+        self.assertEqual([tuple(row) for row in self.graph.query(query)], [(EX.bob,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,7 @@
+import os
+import shutil
 import unittest
+from tempfile import mkdtemp
 
 try:
     from unittest.mock import patch, MagicMock
@@ -9,13 +12,27 @@ import six
 
 from rdflib import (
     ConjunctiveGraph,
+    Dataset,
+    Graph,
     Literal,
+    RDF,
     URIRef,
     plugin
 )
-from rdflib.store import Store
+from rdflib.graph import QuotedGraph
+from rdflib.namespace import XSD
+from rdflib.plugins.stores.regexmatching import REGEXTerm
+from rdflib.store import Store, TripleAddedEvent
 
 from rdflib_sqlalchemy import registerplugins
+from rdflib_sqlalchemy.bulk import copy_text
+from rdflib_sqlalchemy.constants import ASSERTED_NON_TYPE_PARTITION
+from rdflib_sqlalchemy.events import TriplesAddedEvent
+from rdflib_sqlalchemy.sql import _compile_regexp, register_sqlite_regexp
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.sql.selectable import Select
 
 
@@ -98,6 +115,22 @@ class SQLATestCase(unittest.TestCase):
     def test__len(self):
         self.assertEqual(self.store.__len__(), 0)
 
+    def test_approximate_len(self):
+        ctx = self.graph.get_context(URIRef('http://example.org/context'))
+        ctx.add((michel, likes, pizza))
+        ctx.add((michel, likes, Literal("pizza", lang="en")))
+        ctx.add((pizza, RDF.type, URIRef("http://example.org/Food")))
+        # There are no statistics before the first ANALYZE
+        self.assertEqual(self.store.approximate_len(), 3 if self.store.maintain_counts else None)
+        with self.store.engine.begin() as connection:
+            connection.exec_driver_sql("ANALYZE")
+        ctx.add((pizza, likes, michel))
+        # The statistics are not updated until the next ANALYZE
+        self.assertEqual(self.store.statistics(approximate=True), {"store": {
+            "total_num_statements": len(self.store) if self.store.maintain_counts else 3}})
+        with self.assertRaises(ValueError):
+            self.store.statistics(types=True, approximate=True)
+
     def test__remove_context(self):
         ctx_id = URIRef('http://example.org/context')
         g = self.graph.get_context(ctx_id)
@@ -123,6 +156,30 @@ class SQLATestCase(unittest.TestCase):
         # Expect two selects: one for the first two choices plus one for the last one
         self.assertEqual(sum(1 for c in children if isinstance(c, Select)), 2)
 
+    def test_regex_triples(self):
+        g = self.graph.get_context(URIRef('http://example.org/context'))
+        g.add((michel, likes, pizza))
+        g.add((pizza, likes, michel))
+        g.add((michel, likes, Literal("pasta")))
+        result = set(t for t, _ in self.store.triples((REGEXTerm("^mic"), likes, REGEXTerm("^p"))))
+        self.assertEqual(result, set([(michel, likes, Literal("pasta")), (michel, likes, pizza)]))
+
+    def test_regex_pooled_connection(self):
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        with engine.connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+        register_sqlite_regexp(engine)
+        misses = _compile_regexp.cache_info().misses
+        with engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql("SELECT 'pizza' REGEXP ?", (self.id(),)).scalar(), 0)
+        self.assertEqual(_compile_regexp.cache_info().misses, misses + 1)
+
+    def test_regex_contexts(self):
+        g = self.graph.get_context(URIRef('http://example.org/context'))
+        g.add((michel, likes, pizza))
+        result = list(self.store.triples((None, None, None), context=REGEXTerm("context$")))
+        self.assertEqual(len(result), 1)
+
     def test_quoted_statements(self):
         '''
         Regression test for RDFLib/rdflib-sqlalchemy#92
@@ -140,5 +197,865 @@ class SQLATestCase(unittest.TestCase):
         # Doesn't raise an exception
 
 
+class StreamingTriplesTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, stream_results=True, fetch_size=2)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def test_contexts_merged(self):
+        ctx1 = self.graph.get_context(URIRef("http://example.org/ctx1"))
+        ctx2 = self.graph.get_context(URIRef("http://example.org/ctx2"))
+        ctx1.add((michel, likes, pizza))
+        ctx2.add((michel, likes, pizza))
+        ctx1.add((michel, likes, Literal("pizza")))
+        ctx2.add((pizza, likes, michel))
+
+        result = dict(
+            (triple, set(c.identifier for c in contexts))
+            for triple, contexts in self.store.triples((None, None, None))
+        )
+        self.assertEqual(result, {
+            (michel, likes, pizza): set([ctx1.identifier, ctx2.identifier]),
+            (michel, likes, Literal("pizza")): set([ctx1.identifier]),
+            (pizza, likes, michel): set([ctx2.identifier]),
+        })
+
+    def test_matches_buffered_results(self):
+        ctx = self.graph.get_context(URIRef("http://example.org/ctx"))
+        for i in range(5):
+            ctx.add((michel, likes, URIRef("thing%d" % i)))
+        streamed = sorted(self.graph.triples((michel, likes, None)))
+        self.store.stream_results = False
+        buffered = sorted(self.graph.triples((michel, likes, None)))
+        self.assertEqual(streamed, buffered)
+        self.assertEqual(len(streamed), 5)
+
+    def test_binary_order(self):
+        selects = self.store._triples_helper((michel, None, None))
+        q = self.store._triples_query(selects)
+        self.assertIn("ORDER BY BINARY subject, BINARY predicate, BINARY object",
+                      str(q.compile(dialect=mysql.dialect())))
+        self.assertIn("ORDER BY subject, predicate, object", str(q.compile(dialect=sqlite.dialect())))
+
+
+class TermDictionaryTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, term_dictionary=True)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+        self.ctx = self.graph.get_context(URIRef("http://example.org/ctx"))
+        self.ctx.add((michel, likes, pizza))
+        self.ctx.add((michel, likes, Literal("pizza", lang="en")))
+        self.ctx.add((pizza, RDF.type, URIRef("http://example.org/Food")))
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def test_terms_stored_once(self):
+        terms = self.store.tables["terms"]
+        with self.store.engine.connect() as connection:
+            texts = [row[0] for row in connection.execute(terms.select().with_only_columns(terms.c.term))]
+        self.assertEqual(len(texts), len(set(texts)))
+        self.assertIn(str(pizza), texts)
+
+    def test_triples(self):
+        self.assertEqual(set(self.graph.triples((michel, likes, None))), set([
+            (michel, likes, pizza),
+            (michel, likes, Literal("pizza", lang="en")),
+        ]))
+        self.assertEqual(list(self.graph.triples((None, RDF.type, None))),
+                         [(pizza, RDF.type, URIRef("http://example.org/Food"))])
+        self.assertEqual(len(list(self.graph.triples((None, None, None)))), 3)
+
+    def test_regex_triples(self):
+        self.assertEqual(list(self.graph.triples((REGEXTerm("^piz"), None, None))),
+                         [(pizza, RDF.type, URIRef("http://example.org/Food"))])
+
+    def test_remove(self):
+        self.ctx.remove((michel, likes, Literal("pizza", lang="en")))
+        self.assertEqual(list(self.graph.triples((michel, likes, None))), [(michel, likes, pizza)])
+
+    def test_contexts(self):
+        self.assertEqual(list(self.store.contexts()), [self.ctx.identifier])
+
+    def test_decoded_from_dictionary(self):
+        self.store._term_texts.clear()
+        self.assertEqual(set(self.graph.objects(michel, likes)),
+                         set([pizza, Literal("pizza", lang="en")]))
+
+
+class HashKeysTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+    prefix = "http://example.org/" + "x" * 300
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, hash_keys=True)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+        self.ctx = self.graph.get_context(URIRef("http://example.org/ctx"))
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def test_indexes_on_hash_keys(self):
+        table = self.store.tables["asserted_statements"]
+        key = [index for index in table.indexes if index.unique][0]
+        self.assertTrue(str(CreateIndex(key).compile(dialect=sqlite.dialect())).endswith(
+            "(subject_hash, predicate_hash, object_hash, context_hash, substr(subject, 1, 64), "
+            "substr(predicate, 1, 64), substr(object, 1, 64), substr(context, 1, 64))"))
+        self.assertIn("subject(64)", str(CreateIndex(key).compile(dialect=mysql.dialect())))
+        lookup = [index for index in table.indexes if not index.unique and index.name.endswith("_s_index")][0]
+        self.assertEqual([c.name for c in lookup.columns], ["subject_hash"])
+
+    def test_long_terms_with_shared_prefix(self):
+        subjects = [URIRef(self.prefix + str(i)) for i in range(3)]
+        for subject in subjects:
+            self.ctx.add((subject, likes, pizza))
+            self.ctx.add((subject, likes, Literal("pizza")))
+        self.assertEqual(len(self.ctx), 6)
+        self.assertEqual(set(self.graph.predicate_objects(subjects[1])),
+                         set([(likes, pizza), (likes, Literal("pizza"))]))
+        self.ctx.remove((subjects[1], likes, None))
+        self.assertEqual(set(self.graph.subjects(likes, pizza)), set([subjects[0], subjects[2]]))
+
+    def test_hash_collision_rechecks_text(self):
+        with patch("rdflib_sqlalchemy.store.term_hash", return_value=0), \
+                patch("rdflib_sqlalchemy.base.term_hash", return_value=0):
+            self.ctx.add((michel, likes, pizza))
+            self.assertEqual(list(self.graph.triples((pizza, likes, pizza))), [])
+            self.assertEqual(list(self.graph.triples((michel, likes, pizza))), [(michel, likes, pizza)])
+
+    def test_hash_collision_keeps_statements(self):
+        with patch("rdflib_sqlalchemy.store.term_hash", return_value=0), \
+                patch("rdflib_sqlalchemy.base.term_hash", return_value=0), \
+                patch("rdflib_sqlalchemy.counts.term_hash", return_value=0):
+            self.ctx.add((michel, likes, pizza))
+            self.ctx.add((pizza, likes, michel))
+            self.ctx.addN([(michel, RDF.value, pizza, self.ctx), (pizza, RDF.value, michel, self.ctx)])
+            self.assertEqual(len(self.ctx), 4)
+            self.assertEqual(set(self.graph.subjects(likes, None)), set([michel, pizza]))
+
+    def test_term_dictionary_hash_collision(self):
+        store = plugin.get("SQLAlchemy", Store)(
+            identifier=URIRef("rdflib_test_dict"), term_dictionary=True, hash_keys=True)
+        graph = ConjunctiveGraph(store)
+        graph.open(self.dburi, create=True)
+        try:
+            with patch("rdflib_sqlalchemy.store.term_hash", return_value=0), \
+                    patch("rdflib_sqlalchemy.base.term_hash", return_value=0):
+                graph.add((michel, likes, pizza))
+                store._term_ids.clear()
+                graph.add((pizza, likes, michel))
+                self.assertEqual(set(graph.triples((None, likes, None))),
+                                 set([(michel, likes, pizza), (pizza, likes, michel)]))
+        finally:
+            graph.destroy(self.dburi)
+            graph.close()
+
+    def test_term_dictionary(self):
+        store = plugin.get("SQLAlchemy", Store)(
+            identifier=URIRef("rdflib_test_dict"), term_dictionary=True, hash_keys=True)
+        graph = ConjunctiveGraph(store)
+        graph.open(self.dburi, create=True)
+        try:
+            subject = URIRef(self.prefix + "0")
+            graph.add((subject, likes, URIRef(self.prefix + "1")))
+            self.assertEqual(list(graph.objects(subject, likes)), [URIRef(self.prefix + "1")])
+        finally:
+            graph.destroy(self.dburi)
+            graph.close()
+
+
+class IndexProfileTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+
+    def _index_columns(self, store, table):
+        return set(
+            tuple(c.name for c in index.columns)
+            for index in store.tables[table].indexes
+            if not index.unique and index.columns.keys() != ["termComb"]
+        )
+
+    def test_read_optimized(self):
+        store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, index_profile="read_optimized")
+        self.assertEqual(self._index_columns(store, "asserted_statements"), set([
+            ("predicate", "object", "subject"),
+            ("object", "subject", "predicate"),
+            ("context", "subject", "predicate", "object"),
+        ]))
+        # The predicate of the rdf:type partition is implied
+        self.assertEqual(self._index_columns(store, "type_statements"), set([
+            ("klass", "member"),
+            ("context", "member", "klass"),
+        ]))
+
+        graph = ConjunctiveGraph(store, identifier=self.identifier)
+        graph.open(self.dburi, create=True)
+        try:
+            graph.add((michel, likes, pizza))
+            graph.add((michel, likes, Literal("pizza")))
+            self.assertEqual(set(graph.subjects(likes, pizza)), set([michel]))
+            self.assertEqual(len(list(graph.triples((None, likes, None)))), 2)
+        finally:
+            graph.destroy(self.dburi)
+            graph.close()
+
+    def test_custom_orderings(self):
+        store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, index_profile=("pos", "spoc"))
+        # The SPOC ordering is the unique key already
+        self.assertEqual(self._index_columns(store, "asserted_statements"),
+                         set([("predicate", "object", "subject")]))
+
+    def test_invalid_profile(self):
+        store_class = plugin.get("SQLAlchemy", Store)
+        self.assertRaises(ValueError, store_class, index_profile="unknown")
+        self.assertRaises(ValueError, store_class, index_profile=("spx",))
+
+
+class LeanSchemaTestCase(SQLATestCase):
+    kwargs = {}
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, configuration=self.dburi, lean_schema=True, **self.kwargs)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+
+    def test_schema(self):
+        table = self.store.tables["asserted_statements"]
+        self.assertNotIn("id", table.c)
+        self.assertEqual([c.name for c in table.primary_key],
+                         ["subject", "predicate", "object", "context"])
+        # The subject index is a prefix of the primary key
+        self.assertEqual(set(tuple(c.name for c in index.columns) for index in table.indexes),
+                         set([("predicate",), ("object",), ("context",)]))
+        literal_table = self.store.tables["literal_statements"]
+        self.assertNotIn("id", literal_table.c)
+        self.assertEqual([index.unique for index in literal_table.indexes if "termComb" in index.columns], [])
+
+    def test_triples(self):
+        ctx = self.graph.get_context(URIRef("http://example.org/ctx"))
+        ctx.add((michel, likes, pizza))
+        ctx.add((michel, likes, pizza))
+        ctx.add((michel, likes, Literal("pizza", lang="en")))
+        ctx.add((pizza, RDF.type, URIRef("http://example.org/Food")))
+        self.assertEqual(len(self.graph), 3)
+        self.assertEqual(set(self.graph.objects(michel, likes)),
+                         set([pizza, Literal("pizza", lang="en")]))
+        self.graph.remove((michel, None, None))
+        self.assertEqual(list(self.graph.triples((None, None, None))),
+                         [(pizza, RDF.type, URIRef("http://example.org/Food"))])
+
+
+class HashKeysLeanSchemaTestCase(LeanSchemaTestCase):
+    kwargs = {"hash_keys": True}
+
+    def test_schema(self):
+        table = self.store.tables["asserted_statements"]
+        self.assertNotIn("id", table.c)
+        self.assertEqual(list(table.primary_key), [])
+        key = [index for index in table.indexes if index.unique][0]
+        self.assertIn("(subject_hash, predicate_hash, object_hash, context_hash, substr(subject, 1, 64)",
+                      str(CreateIndex(key).compile(dialect=sqlite.dialect())))
+
+
+class CountsTestCase(SQLATestCase):
+    kwargs = {}
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, configuration=self.dburi, maintain_counts=True, **self.kwargs)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+        self.ctx1 = self.graph.get_context(URIRef("http://example.org/ctx1"))
+        self.ctx2 = self.graph.get_context(URIRef("http://example.org/ctx2"))
+
+    def assertCounts(self):
+        self.assertEqual(self.store.verify_counts(), {})
+        for context in (self.ctx1, self.ctx2):
+            self.assertEqual(self.store.__len__(context), self.store._exact_len(context))
+        # A triple asserted in both contexts is counted twice
+        self.assertEqual(len(self.store), len(self.ctx1) + len(self.ctx2))
+
+    def test_add(self):
+        self.ctx1.add((michel, likes, pizza))
+        self.ctx1.add((michel, likes, pizza))
+        self.ctx1.add((michel, likes, Literal("pizza")))
+        self.ctx2.add((pizza, RDF.type, URIRef("http://example.org/Food")))
+        self.assertEqual((len(self.ctx1), len(self.ctx2), len(self.graph)), (2, 1, 3))
+        self.assertCounts()
+
+    def test_add_literals(self):
+        for _ in range(3):
+            self.ctx1.add((michel, likes, Literal("pizza")))
+            self.ctx1.add((michel, likes, Literal("1", datatype=XSD.integer)))
+        self.ctx1.add((michel, likes, Literal("1")))
+        self.ctx1.add((michel, likes, Literal("pizza", lang="en")))
+        self.ctx1.add((michel, likes, Literal("pizza", lang="it")))
+        self.assertEqual(len(self.ctx1), 5)
+        self.assertCounts()
+
+    def test_addN(self):
+        quads = [
+            (michel, likes, pizza, self.ctx1),
+            (michel, likes, Literal("pizza", lang="en"), self.ctx1),
+            (michel, likes, pizza, self.ctx2),
+            (pizza, RDF.type, URIRef("http://example.org/Food"), self.ctx2),
+        ]
+        self.graph.addN(quads)
+        self.graph.addN(quads)
+        self.assertEqual((len(self.ctx1), len(self.ctx2)), (2, 2))
+        self.assertCounts()
+
+    def test_remove(self):
+        self.ctx1.add((michel, likes, pizza))
+        self.ctx1.add((michel, likes, Literal("pizza")))
+        self.ctx2.add((michel, likes, pizza))
+        self.ctx2.add((pizza, RDF.type, URIRef("http://example.org/Food")))
+        self.ctx1.remove((michel, likes, Literal("pizza")))
+        self.assertCounts()
+        self.graph.remove((michel, None, None))
+        self.assertCounts()
+        self.assertEqual(len(self.ctx2), 1)
+        self.store._remove_context(self.ctx2)
+        self.assertEqual(len(self.graph), 0)
+        self.assertCounts()
+
+    def test_quoted(self):
+        self.graph.parse(data="{ <http://example.org/a> <http://example.org/b> <http://example.org/c> } "
+                              "<http://example.org/d> <http://example.org/e> .", format="n3")
+        self.assertEqual(self.store.verify_counts(), {})
+        # The quoted statement is not part of the length of the store
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual(len(self.store), self.store._exact_len())
+
+    def test_repair(self):
+        self.ctx1.add((michel, likes, pizza))
+        counts = self.store.tables["statement_counts"]
+        with self.store.engine.begin() as connection:
+            connection.execute(counts.delete())
+        self.assertEqual(len(self.ctx1), 0)
+        self.assertEqual(self.store.verify_counts(repair=True), {
+            (str(self.ctx1.identifier), ASSERTED_NON_TYPE_PARTITION): (0, 1),
+            None: (0, 1),
+        })
+        self.assertEqual(len(self.ctx1), 1)
+        self.assertEqual(self.store.verify_counts(), {})
+
+    def test_shared_triple(self):
+        self.ctx1.add((michel, likes, pizza))
+        self.ctx2.add((michel, likes, pizza))
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store._exact_len(), 2)
+        self.assertCounts()
+
+
+class TermDictionaryCountsTestCase(CountsTestCase):
+    kwargs = {"term_dictionary": True, "hash_keys": True}
+
+
+class GraphAwareTestCase(SQLATestCase):
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, configuration=self.dburi, graph_aware=True)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+
+    def test__remove_context(self):
+        ctx_id = URIRef('http://example.org/context')
+        g = self.graph.get_context(ctx_id)
+        g.add((michel, likes, pizza))
+        self.store._remove_context(g)
+        self.assertEqual(len(g), 0)
+        self.assertEqual(list(self.store.contexts()), [ctx_id])
+
+    def test_empty_graphs(self):
+        dataset = Dataset(self.store)
+        g = dataset.graph(URIRef('http://example.org/empty'))
+        self.assertIn(g.identifier, set(self.store.contexts()))
+        g.add((michel, likes, pizza))
+        dataset.remove_graph(g)
+        self.assertNotIn(g.identifier, set(self.store.contexts()))
+        self.assertEqual(list(self.store.triples((None, None, None))), [])
+
+    def test_addN(self):
+        ctx1 = self.graph.get_context(URIRef('http://example.org/ctx1'))
+        ctx2 = self.graph.get_context(URIRef('http://example.org/ctx2'))
+        self.graph.addN([(michel, likes, pizza, ctx1), (pizza, RDF.type, likes, ctx2)])
+        self.assertEqual(set(self.store.contexts()), set([ctx1.identifier, ctx2.identifier]))
+        self.assertEqual(list(self.store.contexts((pizza, None, None))), [ctx2.identifier])
+
+    def test_registry_of_existing_store(self):
+        directory = mkdtemp()
+        dburi = Literal("sqlite:///" + os.path.join(directory, "store.sqlite"))
+        try:
+            store = plugin.get("SQLAlchemy", Store)(identifier=self.identifier)
+            store.open(dburi, create=True)
+            store.add((michel, likes, pizza), Graph(store, URIRef('http://example.org/context')))
+            store.close()
+
+            store = plugin.get("SQLAlchemy", Store)(identifier=self.identifier, graph_aware=True)
+            store.open(dburi, create=True)
+            self.assertEqual(list(store.contexts()), [URIRef('http://example.org/context')])
+            store.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class ContextsPagingTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+    kwargs = {}
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, contexts_page_size=2, **self.kwargs)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+        self.ids = [URIRef("http://example.org/ctx%d" % i) for i in range(5)]
+        statements = [
+            (michel, likes, pizza),
+            (michel, likes, Literal("pizza", lang="en")),
+            (pizza, RDF.type, likes),
+        ]
+        for i, ctx_id in enumerate(self.ids):
+            self.graph.get_context(ctx_id).add(statements[i % 3])
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def test_pages(self):
+        self.assertEqual(sorted(self.store.contexts()), self.ids)
+        self.assertEqual(sorted(self.store.contexts((michel, None, None))),
+                         [self.ids[0], self.ids[1], self.ids[3], self.ids[4]])
+
+    def test_page_queries(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.store.engine, "before_cursor_execute", record)
+        try:
+            list(self.store.contexts())
+        finally:
+            event.remove(self.store.engine, "before_cursor_execute", record)
+        # Two full pages, and a last one that is not
+        self.assertEqual(len([statement for statement in statements if "LIMIT" in statement]), 3)
+
+    def test_count_contexts(self):
+        self.assertEqual(self.store.count_contexts(), 5)
+        self.assertEqual(self.store.count_contexts((pizza, None, None)), 1)
+
+
+class TermDictionaryContextsPagingTestCase(ContextsPagingTestCase):
+    kwargs = {"term_dictionary": True}
+
+
+class GraphAwareContextsPagingTestCase(ContextsPagingTestCase):
+    kwargs = {"graph_aware": True}
+
+
+class TriplesChoicesTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+    kwargs = {}
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(identifier=self.identifier, **self.kwargs)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+        self.ctx = self.graph.get_context(URIRef("http://example.org/ctx"))
+        self.objects = [URIRef("http://example.org/o%d" % i) for i in range(10)]
+        for o in self.objects:
+            self.ctx.add((michel, likes, o))
+        self.ctx.add((michel, likes, Literal("pizza", lang="en")))
+        self.ctx.add((pizza, RDF.type, likes))
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def choices(self, triple):
+        return set(t for t, _ in self.store.triples_choices(triple))
+
+    def test_objects(self):
+        choices = self.objects[::2] + [Literal("pizza", lang="en"), URIRef("http://example.org/missing")]
+        self.assertEqual(self.choices((michel, likes, choices)),
+                         set([(michel, likes, o) for o in choices[:-1]]))
+
+    def test_subjects(self):
+        self.assertEqual(self.choices(([michel, pizza, likes], RDF.type, None)), set([(pizza, RDF.type, likes)]))
+
+    def test_predicates(self):
+        self.assertEqual(len(self.choices((michel, [likes, RDF.value], None))), 11)
+
+    def test_empty(self):
+        self.assertEqual(len(self.choices((michel, likes, []))), 11)
+
+
+class ChoicesTableTestCase(TriplesChoicesTestCase):
+    kwargs = {"choices_table_threshold": 1}
+
+    def test_single_query(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.store.engine, "before_cursor_execute", record)
+        try:
+            self.choices((michel, likes, self.objects))
+        finally:
+            event.remove(self.store.engine, "before_cursor_execute", record)
+        self.assertEqual(len([statement for statement in statements if "_statements" in statement]), 1)
+        self.assertEqual(len([statement for statement in statements if "TEMPORARY" in statement]), 1)
+
+
+class TermDictionaryChoicesTableTestCase(ChoicesTableTestCase):
+    kwargs = {"choices_table_threshold": 1, "term_dictionary": True, "hash_keys": True}
+
+
+class HashKeysChoicesTableTestCase(ChoicesTableTestCase):
+    kwargs = {"choices_table_threshold": 1, "hash_keys": True, "stream_results": True}
+
+
+class QueryCacheTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+    kwargs = {}
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(identifier=self.identifier, **self.kwargs)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+        self.ctx = self.graph.get_context(URIRef("http://example.org/ctx"))
+        self.ctx.add((michel, likes, pizza))
+        self.ctx.add((pizza, likes, michel))
+        self.ctx.add((michel, likes, Literal("pasta", lang="en")))
+        self.ctx.add((michel, likes, Literal("pasta", lang="fr")))
+        self.ctx.add((michel, likes, Literal("1", datatype=XSD.integer)))
+        self.ctx.add((pizza, RDF.type, likes))
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def triples(self, triple, context=None):
+        return set(t for t, _ in self.store.triples(triple, context))
+
+    def test_reused_by_shape(self):
+        self.assertEqual(self.triples((michel, likes, pizza), self.ctx), set([(michel, likes, pizza)]))
+        self.assertEqual(self.triples((pizza, likes, michel), self.ctx), set([(pizza, likes, michel)]))
+        self.assertEqual(len(self.store._triples_queries), 1)
+        self.assertEqual(self.triples((pizza, likes, pizza), self.ctx), set())
+        self.assertEqual(len(self.store._triples_queries), 1)
+
+    def test_literals(self):
+        self.assertEqual(self.triples((michel, likes, Literal("pasta", lang="fr"))),
+                         set([(michel, likes, Literal("pasta", lang="fr"))]))
+        self.assertEqual(self.triples((michel, likes, Literal("pasta", lang="en"))),
+                         set([(michel, likes, Literal("pasta", lang="en"))]))
+        self.assertEqual(self.triples((michel, likes, Literal(1))), set([(michel, likes, Literal(1))]))
+
+    def test_quoted_literal_subject(self):
+        formula = QuotedGraph(self.store, URIRef("http://example.org/formula"))
+        formula.add((michel, likes, Literal("pasta", lang="en")))
+        formula.add((michel, likes, pizza))
+        self.assertEqual(self.triples((Literal("pasta", lang="fr"), likes, pizza), formula), set())
+        self.assertEqual(self.triples((michel, likes, pizza), formula), set([(michel, likes, pizza)]))
+        self.assertEqual(
+            self.triples((Literal("1", datatype=XSD.integer), likes, Literal("pasta", lang="en")), formula), set())
+        self.assertEqual(self.triples((michel, likes, Literal("pasta", lang="en")), formula),
+                         set([(michel, likes, Literal("pasta", lang="en"))]))
+        self.assertEqual(len(self.store._triples_queries), 4)
+        # The language and datatype of a literal subject are not bound as those of the object
+        values = self.store._pattern_values((Literal("1", datatype=XSD.integer), likes, pizza), formula)
+        self.assertNotIn("object_datatype", values)
+        values = self.store._pattern_values((Literal("pasta", lang="fr"), likes, Literal("1", datatype=XSD.integer)),
+                                            formula)
+        self.assertNotIn("object_language", values)
+
+    def test_type_predicate(self):
+        self.assertEqual(self.triples((None, RDF.type, likes)), set([(pizza, RDF.type, likes)]))
+        self.assertEqual(self.triples((None, RDF.type, pizza)), set())
+
+    def test_uncached_patterns(self):
+        self.assertEqual(self.triples((REGEXTerm("^piz"), likes, None)), set([(pizza, likes, michel)]))
+        self.assertEqual(self.store._triples_queries, {})
+
+    def test_exists(self):
+        self.assertTrue(self.store.exists((michel, likes, pizza)))
+        self.assertTrue(self.store.exists((michel, likes, pizza), self.ctx))
+        self.assertTrue(self.store.exists((None, RDF.type, likes)))
+        self.assertTrue(self.store.exists((None, None, Literal("pasta", lang="fr"))))
+        self.assertFalse(self.store.exists((pizza, likes, pizza)))
+        self.assertFalse(self.store.exists((None, None, Literal("pasta", lang="de"))))
+        other = self.graph.get_context(URIRef("http://example.org/other"))
+        self.assertFalse(self.store.exists((michel, likes, pizza), other))
+        self.assertTrue(self.store.exists((REGEXTerm("^piz"), None, None)))
+
+    def test_first(self):
+        self.assertEqual(self.store.first((pizza, likes, None)), (pizza, likes, michel))
+        self.assertEqual(self.store.first((None, RDF.type, likes)), (pizza, RDF.type, likes))
+        self.assertEqual(self.store.first((None, likes, Literal(1))), (michel, likes, Literal(1)))
+        self.assertIn(self.store.first((michel, likes, None), self.ctx), set(self.ctx.triples((michel, likes, None))))
+        self.assertIsNone(self.store.first((pizza, RDF.type, pizza)))
+
+    def test_distinct_terms(self):
+        self.assertEqual(set(self.store.distinct_terms((None, likes, None), "subject")), set([michel, pizza]))
+        self.assertEqual(set(self.store.distinct_terms((michel, None, None), "predicate")), set([likes]))
+        self.assertEqual(set(self.store.distinct_terms((pizza, None, None), "predicate")), set([likes, RDF.type]))
+        self.assertEqual(set(self.store.distinct_terms((None, RDF.type, None), "object")), set([likes]))
+        self.assertEqual(set(self.store.distinct_terms((michel, likes, None), "object", self.ctx)), set([
+            pizza, Literal("pasta", lang="en"), Literal("pasta", lang="fr"), Literal(1)]))
+        self.assertEqual(set(self.store.distinct_terms((REGEXTerm("^piz"), None, None), "object")),
+                         set([michel, likes]))
+
+    def test_union_all(self):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if "_statements" in statement:
+                statements.append(statement)
+        event.listen(self.store.engine, "before_cursor_execute", record)
+        self.assertEqual(len(self.triples((michel, likes, None))), 4)
+        self.assertIn("UNION ALL", statements[-1])
+        self.assertEqual(len(self.triples((michel, likes, None), self.ctx)), 4)
+        self.assertIn("quoted_statements", statements[-1])
+        self.assertNotIn("UNION ALL", statements[-1])
+
+    def test_repeated_choices(self):
+        self.store.max_terms_per_where = 1
+        self.assertEqual([(triple, [c.identifier for c in contexts])
+                          for triple, contexts in self.store.triples_choices((michel, likes, [pizza, pizza]))],
+                         [((michel, likes, pizza), [self.ctx.identifier])])
+
+
+class TermDictionaryQueryCacheTestCase(QueryCacheTestCase):
+    kwargs = {"term_dictionary": True, "hash_keys": True}
+
+
+class HashKeysQueryCacheTestCase(QueryCacheTestCase):
+    kwargs = {"hash_keys": True, "stream_results": True}
+
+
+class ChunkedAddNTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+    commit_per_chunk = False
+    kwargs = {}
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(
+            identifier=self.identifier, chunk_size=2, commit_per_chunk=self.commit_per_chunk, **self.kwargs)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def quads(self, n):
+        for i in range(n):
+            yield (michel, likes, URIRef("http://example.org/food/{}".format(i)), self.graph)
+
+    def test_chunks(self):
+        reported = []
+        self.store.addN(self.quads(5), progress=lambda added, seconds: reported.append(added))
+        self.assertEqual(reported, [2, 4, 5])
+        self.assertEqual(len(self.graph), 5)
+
+    def test_failed_chunk(self):
+        quads = list(self.quads(4)) + [(Literal("pizza"), RDF.type, likes, self.graph)]
+        with self.assertRaises(ValueError):
+            self.store.addN(quads)
+        self.assertEqual(len(self.graph), 4 if self.commit_per_chunk else 0)
+        # The terms of the rolled back chunks can be added again
+        self.store.addN(self.quads(5))
+        self.assertEqual(set(self.graph.triples((None, None, None))),
+                         set(quad[:3] for quad in self.quads(5)))
+
+    def test_events(self):
+        chunks = []
+        triples = []
+        self.store.dispatcher.subscribe(TriplesAddedEvent, lambda event: chunks.append(len(event.quads)))
+        self.store.addN(self.quads(5))
+        self.assertEqual(chunks, [2, 2, 1])
+        self.store.dispatcher.subscribe(TripleAddedEvent, lambda event: triples.append(event.triple))
+        self.store.addN(self.quads(3))
+        self.assertEqual(chunks, [2, 2, 1, 2, 1])
+        self.assertEqual(len(triples), 3)
+
+    def test_no_subscribers(self):
+        with patch.object(Store, "add") as add:
+            self.store.addN(self.quads(5))
+        self.assertFalse(add.called)
+        self.assertEqual(len(self.graph), 5)
+
+
+class CommitPerChunkAddNTestCase(ChunkedAddNTestCase):
+    commit_per_chunk = True
+
+
+class TermDictionaryChunkedAddNTestCase(ChunkedAddNTestCase):
+    kwargs = {"term_dictionary": True}
+
+
+class TermDictionaryCommitPerChunkAddNTestCase(ChunkedAddNTestCase):
+    commit_per_chunk = True
+    kwargs = {"term_dictionary": True}
+
+
+class BulkLoadTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+    dburi = Literal("sqlite://")
+    kwargs = {}
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(identifier=self.identifier, **self.kwargs)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(self.dburi, create=True)
+        self.ctx1 = self.graph.get_context(URIRef("http://example.org/ctx1"))
+        self.ctx2 = self.graph.get_context(URIRef("http://example.org/ctx2"))
+        self.quads = [
+            (michel, likes, pizza, self.ctx1),
+            (michel, likes, pizza, self.ctx2),
+            (michel, likes, Literal("pizza\tand\npasta", lang="en"), self.ctx1),
+            (michel, likes, Literal("back\\slash", datatype=XSD.string), self.ctx1),
+            (pizza, RDF.type, URIRef("http://example.org/Food"), self.ctx2),
+        ]
+
+    def tearDown(self):
+        self.graph.destroy(self.dburi)
+        self.graph.close()
+
+    def loaded(self):
+        return set((s, p, o, c.identifier) for s, p, o, c in self.graph.quads((None, None, None)))
+
+    def test_bulk_load(self):
+        self.store.bulk_load(self.quads)
+        self.assertEqual(self.loaded(), set((s, p, o, c.identifier) for s, p, o, c in self.quads))
+
+    def test_batches(self):
+        self.store.bulk_load(iter(self.quads), batch_size=2)
+        self.assertEqual(len(self.loaded()), len(self.quads))
+
+    def test_events(self):
+        chunks = []
+        self.store.dispatcher.subscribe(TriplesAddedEvent, lambda event: chunks.append(len(event.quads)))
+        self.store.bulk_load(self.quads, batch_size=2)
+        self.assertEqual(chunks, [2, 2, 1])
+
+    def test_existing_statements(self):
+        self.ctx1.add((michel, likes, pizza))
+        self.store.bulk_load(self.quads + self.quads)
+        self.assertEqual((len(self.ctx1), len(self.ctx2)), (3, 2))
+
+    def test_quoted(self):
+        formula = QuotedGraph(self.store, URIRef("http://example.org/formula"))
+        self.store.bulk_load([(michel, likes, pizza, formula), (michel, likes, formula, self.ctx1)])
+        self.assertEqual(len(self.graph), 1)
+        self.assertEqual(list(formula), [(michel, likes, pizza)])
+
+    def test_error(self):
+        self.ctx1.add((michel, likes, pizza))
+        with patch.object(self.store, "_merge_staging_table", side_effect=ValueError("merge")):
+            with self.assertRaisesRegex(ValueError, "merge"):
+                self.store.bulk_load(self.quads, batch_size=2)
+        # Nothing is left of the failed load, not even the ids of its terms
+        self.store.bulk_load(self.quads)
+        self.assertEqual(self.loaded(), set((s, p, o, c.identifier) for s, p, o, c in self.quads))
+
+    def test_copy_text(self):
+        self.assertEqual(copy_text([("a\tb", None, 1), ("c\\d\ne", "", 2)]),
+                         "a\\tb\t\\N\t1\nc\\\\d\\ne\t\t2\n")
+
+
+class TermDictionaryBulkLoadTestCase(BulkLoadTestCase):
+    kwargs = {"term_dictionary": True, "hash_keys": True}
+
+
+class CountsBulkLoadTestCase(BulkLoadTestCase):
+    kwargs = {"maintain_counts": True, "graph_aware": True, "hash_keys": True}
+
+    def test_bulk_load(self):
+        super(CountsBulkLoadTestCase, self).test_bulk_load()
+        self.assertEqual(self.store.verify_counts(), {})
+        self.assertEqual(set(self.store.contexts()), set([self.ctx1.identifier, self.ctx2.identifier]))
+
+    def test_existing_statements(self):
+        super(CountsBulkLoadTestCase, self).test_existing_statements()
+        self.assertEqual(self.store.verify_counts(), {})
+
+    def test_without_returning(self):
+        # The statements added to each context are then counted by one insert per context
+        with patch.object(self.store.engine.dialect, "insert_returning", False):
+            self.test_existing_statements()
+
+
+class BulkModeTestCase(unittest.TestCase):
+    identifier = URIRef("rdflib_test")
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.store = plugin.get("SQLAlchemy", Store)(identifier=self.identifier)
+        self.graph = ConjunctiveGraph(self.store, identifier=self.identifier)
+        self.graph.open(Literal("sqlite:///" + os.path.join(self.directory, "store.sqlite")), create=True)
+        self.table = self.store.tables["asserted_statements"]
+
+    def tearDown(self):
+        self.graph.close()
+        shutil.rmtree(self.directory)
+
+    def index_names(self):
+        return set(index["name"] for index in inspect(self.store.engine).get_indexes(self.table.name))
+
+    def synchronous(self):
+        with self.store.engine.connect() as connection:
+            return connection.exec_driver_sql("PRAGMA synchronous").scalar()
+
+    def test_bulk_mode(self):
+        indexes = self.index_names()
+        synchronous = self.synchronous()
+        with self.store.bulk_mode():
+            self.assertEqual(self.index_names(), set(index.name for index in self.table.indexes if index.unique))
+            self.assertEqual(self.synchronous(), 0)
+            self.store.bulk_load([(michel, likes, pizza, self.graph)])
+        self.assertEqual(self.index_names(), indexes)
+        self.assertEqual(self.synchronous(), synchronous)
+        self.assertEqual(len(self.graph), 1)
+        with self.store.engine.connect() as connection:
+            self.assertIn(self.table.name, connection.exec_driver_sql("SELECT tbl FROM sqlite_stat1").scalars().all())
+
+    def test_error(self):
+        indexes = self.index_names()
+        with self.assertRaises(ValueError):
+            with self.store.bulk_mode(pragmas=(), analyze=False):
+                raise ValueError()
+        self.assertEqual(self.index_names(), indexes)
+
+
 if __name__ == "__main__":
     unittest.main()
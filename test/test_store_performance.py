@@ -6,7 +6,9 @@ import shutil
 from time import time
 from tempfile import mkdtemp
 
-from rdflib import Graph
+from rdflib import Graph, plugin
+from rdflib.namespace import FOAF, RDF
+from rdflib.store import Store
 from six.moves.urllib.request import pathname2url
 
 try:
@@ -111,5 +113,63 @@ class SQLAlchemyStoreTestCase(StoreTestCase):
         StoreTestCase.setUp(self)
 
 
+class IndexProfileLatencyTestCase(unittest.TestCase):
+    """
+    Compare the lookup latency of the index profiles on a mix of triple
+    patterns, each with a different combination of bound positions.
+    """
+    performancetest = True
+    profiles = ["default", "read_optimized"]
+    rounds = 20
+
+    def setUp(self):
+        self.input = Graph()
+        self.input.parse(location=os.getcwd() + '/test/sp2b/10ktriples.n3', format="n3")
+
+    def _patterns(self):
+        person = list(self.input.subjects(RDF.type, FOAF.Person))[5]
+        name = self.input.value(person, FOAF.name)
+        document, _ = next(self.input.subject_predicates(person))
+        return [
+            (person, None, None),
+            (None, FOAF.name, name),
+            (None, None, person),
+            (document, None, person),
+            (None, RDF.type, FOAF.Person),
+        ]
+
+    def _lookup_times(self, profile, patterns):
+        store = plugin.get("SQLAlchemy", Store)(index_profile=profile)
+        graph = Graph(store)
+        graph.open("sqlite://", create=True)
+        try:
+            graph.addN(tuple(t) + (graph,) for t in self.input)
+            times = []
+            results = []
+            for pattern in patterns:
+                t0 = time()
+                for _i in range(self.rounds):
+                    matches = list(graph.triples(pattern))
+                times.append((time() - t0) / self.rounds)
+                results.append(sorted(matches))
+            return times, results
+        finally:
+            graph.destroy("sqlite://")
+            graph.close()
+
+    def testLookupTime(self):
+        patterns = self._patterns()
+        print('"Lookup pattern mix": [')
+        expected = None
+        for profile in self.profiles:
+            times, results = self._lookup_times(profile, patterns)
+            if expected is None:
+                expected = results
+            self.assertEqual(results, expected)
+            print("%s: %s (total %.3gs)" % (
+                profile, " ".join("%.3gs" % t for t in times), sum(times)))
+        print("],")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+from rdflib import BNode, ConjunctiveGraph, Literal, URIRef, plugin
+from rdflib.namespace import XSD
+from rdflib.store import Store
+
+from rdflib_sqlalchemy.termutils import TermCache, create_term
+
+
+class TermCacheTestCase(unittest.TestCase):
+    """Test the least recently used eviction of TermCache."""
+
+    def test_evicts_least_recently_used(self):
+        cache = TermCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache.get("a"), 1)
+        cache["c"] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+        self.assertIn("c", cache)
+
+    def test_unbounded(self):
+        cache = TermCache(None)
+        cache.update(dict((i, i) for i in range(100)))
+        self.assertEqual(len(cache), 100)
+
+    def test_disabled(self):
+        cache = TermCache(0)
+        cache["a"] = 1
+        self.assertIsNone(cache.get("a"))
+
+
+class CreateTermTestCase(unittest.TestCase):
+    """Test the caching of decoded terms by create_term."""
+
+    def setUp(self):
+        self.store = plugin.get("SQLAlchemy", Store)(term_cache_size=2)
+
+    def test_literal_hits(self):
+        for _i in range(3):
+            term = create_term("1", "L", self.store, None, str(XSD.integer))
+        self.assertEqual(term, Literal(1))
+        self.assertEqual((self.store.cacheMisses, self.store.cacheHits), (1, 2))
+
+        term = create_term("chat", "L", self.store, "fr", None)
+        self.assertEqual(term, Literal("chat", lang="fr"))
+        term = create_term("chat", "L", self.store, "fr", None)
+        self.assertEqual((self.store.cacheMisses, self.store.cacheHits), (2, 3))
+
+    def test_kinds_cached_apart(self):
+        self.assertEqual(create_term("x", "U", self.store), URIRef("x"))
+        self.assertEqual(create_term("x", "B", self.store), BNode("x"))
+        self.assertEqual(create_term("x", "L", self.store), Literal("x"))
+        self.assertEqual(self.store.cacheMisses, 3)
+
+    def test_bounded(self):
+        for i in range(10):
+            create_term("http://example.org/%d" % i, "U", self.store)
+        self.assertEqual(len(self.store.uriCache), 2)
+
+
+class StoreTermCacheTestCase(unittest.TestCase):
+    def test_repeated_reads_hit(self):
+        store = plugin.get("SQLAlchemy", Store)(identifier=URIRef("rdflib_test"))
+        graph = ConjunctiveGraph(store, identifier=URIRef("rdflib_test"))
+        graph.open(Literal("sqlite://"), create=True)
+        try:
+            graph.add((URIRef("michel"), URIRef("likes"), Literal("pizza", lang="en")))
+            list(graph.triples((None, None, None)))
+            misses = store.cacheMisses
+            list(graph.triples((None, None, None)))
+            self.assertEqual(store.cacheMisses, misses)
+            self.assertGreater(store.cacheHits, 0)
+        finally:
+            graph.destroy(Literal("sqlite://"))
+            graph.close()
+
+    def test_context_graphs_shared(self):
+        store = plugin.get("SQLAlchemy", Store)(identifier=URIRef("rdflib_test"))
+        graph = ConjunctiveGraph(store, identifier=URIRef("rdflib_test"))
+        graph.open(Literal("sqlite://"), create=True)
+        try:
+            ctx = graph.get_context(URIRef("http://example.org/ctx"))
+            ctx.add((URIRef("michel"), URIRef("likes"), URIRef("pizza")))
+            ctx.add((URIRef("michel"), URIRef("likes"), URIRef("pasta")))
+            contexts = [c for _, cs in store.triples((None, None, None)) for c in cs]
+            contexts.extend(c for _, cs in store.triples((None, None, None)) for c in cs)
+            self.assertEqual(len(contexts), 4)
+            self.assertEqual(contexts[0].identifier, ctx.identifier)
+            self.assertTrue(all(c is contexts[0] for c in contexts))
+        finally:
+            graph.destroy(Literal("sqlite://"))
+            graph.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
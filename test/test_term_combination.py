@@ -0,0 +1,27 @@
+import unittest
+
+from rdflib import BNode, Graph, Literal, URIRef, Variable
+from rdflib.graph import QuotedGraph
+
+from rdflib_sqlalchemy.termutils import statement_to_term_combination, term_combination
+
+
+class TermCombinationTestCase(unittest.TestCase):
+    """Test the term_combination function."""
+
+    def test_statement_to_term_combination(self):
+        graph = Graph(identifier=URIRef("http://example.org/graph"))
+        formula = QuotedGraph("default", URIRef("http://example.org/formula"))
+        terms = [URIRef("http://example.org/a"), BNode(), Literal("a", lang="en"), Variable("a"), formula]
+        for subject in terms:
+            for obj in terms:
+                for context in (graph, Graph(identifier=BNode()), formula):
+                    if isinstance(subject, Literal):
+                        continue
+                    self.assertEqual(
+                        term_combination(subject, URIRef("http://example.org/p"), obj, context),
+                        statement_to_term_combination(subject, URIRef("http://example.org/p"), obj, context))
+
+    def test_literal_subject(self):
+        with self.assertRaises(KeyError):
+            term_combination(Literal("a"), URIRef("http://example.org/p"), Literal("b"), Graph())